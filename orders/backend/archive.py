@@ -0,0 +1,75 @@
+import time
+
+from django.db import connection, transaction
+
+from .models import Order
+
+# Конечные статусы — из них переходов нет, такие заказы больше не меняются.
+TERMINAL_STATUSES = tuple(status for status, targets in Order.TRANSITIONS.items() if not targets)
+
+# Одна пачка — один запрос: выбрать заказы (занятые кем-то пропускаются),
+# скопировать заказ, позиции и историю в архив и удалить оригиналы. Все
+# части запроса видят один снимок данных, внешние ключи проверяются в конце
+# транзакции.
+ARCHIVE_CHUNK_SQL = '''
+    WITH chunk AS (
+        SELECT id FROM backend_order
+        WHERE status = ANY(%s) AND created_at < %s AND id > %s
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ), archived_orders AS (
+        INSERT INTO backend_archivedorder
+            (id, user_id, contact_id, number, created_at, total, status, version, snapshot)
+        SELECT o.id, o.user_id, o.contact_id, o.number, o.created_at, o.total, o.status, o.version, o.snapshot
+        FROM backend_order AS o JOIN chunk USING (id)
+    ), archived_items AS (
+        INSERT INTO backend_archivedorderitem (id, order_id, product_info_id, quantity, price)
+        SELECT i.id, i.order_id, i.product_info_id, i.quantity, i.price
+        FROM backend_orderitem AS i JOIN chunk ON chunk.id = i.order_id
+    ), archived_history AS (
+        INSERT INTO backend_archivedorderstatushistory (id, order_id, status, changed_at, note)
+        SELECT h.id, h.order_id, h.status, h.changed_at, h.note
+        FROM backend_orderstatushistory AS h JOIN chunk ON chunk.id = h.order_id
+    ), deleted_items AS (
+        DELETE FROM backend_orderitem WHERE order_id IN (SELECT id FROM chunk)
+    ), deleted_history AS (
+        DELETE FROM backend_orderstatushistory WHERE order_id IN (SELECT id FROM chunk)
+    ), deleted_reservations AS (
+        DELETE FROM backend_stockreservation WHERE order_id IN (SELECT id FROM chunk)
+    )
+    DELETE FROM backend_order WHERE id IN (SELECT id FROM chunk)
+    RETURNING id
+'''
+
+
+def archive_chunk(cutoff, after_id=0, chunk_size=500):
+    """
+    Переносит в архив до chunk_size заказов в конечных статусах, созданных
+    раньше cutoff, с id больше after_id. Отдельная короткая транзакция;
+    возвращает перенесённые id по возрастанию.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(ARCHIVE_CHUNK_SQL, [list(TERMINAL_STATUSES), cutoff, after_id, chunk_size])
+        return sorted(pk for pk, in cursor.fetchall())
+
+
+def archive_orders(cutoff, chunk_size=500, max_chunks=None, pause=0, progress=None):
+    """
+    Переносит в архив все подходящие заказы пачками. Прерванный перенос
+    продолжается повторным запуском: перенесённые пачки уже закоммичены.
+    progress(перенесено всего) вызывается после каждой пачки.
+    """
+    archived = chunks = after_id = 0
+    while max_chunks is None or chunks < max_chunks:
+        ids = archive_chunk(cutoff, after_id, chunk_size)
+        if not ids:
+            break
+        archived += len(ids)
+        chunks += 1
+        after_id = ids[-1]
+        if progress:
+            progress(archived)
+        if pause:
+            time.sleep(pause)
+    return archived
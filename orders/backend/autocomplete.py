@@ -0,0 +1,336 @@
+import copy
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from itertools import islice
+
+from django.db import connection
+from django.db.models import Count, Exists, Max, OuterRef, Q
+
+from .cache import autocomplete_version
+from .models import Category, Product, ProductInfo, ProductInfoChange
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+# Префиксы не длиннее этого покрывают большую часть индекса: для них
+# списки записей в порядке ранга строятся заранее.
+SHORT_PREFIX = 3
+
+# Сколько кандидатов самого узкого слова проверяет поиск. Запрос из
+# коротких слов, которому ничего не подходит, иначе прошёл бы весь список.
+SCAN_LIMIT = 2000
+
+# Больше стольких изменённых записей индекс дешевле построить заново,
+# чем вставлять их по одной.
+PATCH_LIMIT = 1000
+
+
+def entry_rank(entry, position):
+    """Ключ ранга: больший вес, затем короче и по алфавиту название."""
+    return -entry['weight'], len(entry['name']), entry['name'], position
+
+
+def entry_tokens(entry):
+    return set(tokenize(f"{entry['name']} {entry.get('category', '')}"))
+
+
+def short_prefixes(text):
+    return [text[:length] for length in range(1, min(len(text), SHORT_PREFIX) + 1)]
+
+
+def prefix_lists(pairs):
+    """{префикс до SHORT_PREFIX символов: номера записей по возрастанию}."""
+    lists = defaultdict(set)
+    for text, position in pairs:
+        for prefix in short_prefixes(text):
+            lists[prefix].add(position)
+    return {prefix: sorted(positions) for prefix, positions in lists.items()}
+
+
+class PrefixIndex:
+    """
+    Префиксный индекс: отсортированный массив пар (слово, номер записи),
+    префикс ищется бисекцией. Номер записи постоянен, порядок подсказок
+    задаёт ранг (entry_rank). Для коротких префиксов номера записей хранятся
+    готовыми списками по рангу, и поиск останавливается, набрав limit
+    подсказок. Индекс не меняется: patched возвращает копию.
+    """
+
+    def __init__(self, entries):
+        # При построении номера записей идут по рангу, как и списки префиксов.
+        self.entries = sorted(entries, key=lambda entry: entry_rank(entry, 0))
+        self.ranks = [entry_rank(entry, position) for position, entry in enumerate(self.entries)]
+        self.keys = {(entry['type'], entry['id']): position for position, entry in enumerate(self.entries)}
+        self.entry_tokens = [entry_tokens(entry) for entry in self.entries]
+        pairs = sorted(
+            (token, position)
+            for position, tokens in enumerate(self.entry_tokens)
+            for token in tokens
+        )
+        self.tokens = [token for token, _ in pairs]
+        self.positions = [position for _, position in pairs]
+        self.short_tokens = prefix_lists(pairs)
+        # Названия целиком — для подсказок, начинающихся с запроса.
+        names = sorted((normalize(entry['name']), position) for position, entry in enumerate(self.entries))
+        self.names = [name for name, _ in names]
+        self.name_positions = [position for _, position in names]
+        self.short_names = prefix_lists(names)
+        self.max_ids = {}
+        for entry in self.entries:
+            self.max_ids[entry['type']] = max(self.max_ids.get(entry['type'], 0), entry['id'])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def max_id(self, entry_type):
+        return self.max_ids.get(entry_type, 0)
+
+    def patched(self, entries):
+        """
+        Копия индекса с новыми записями и новыми весами известных. Копируются
+        только затронутые списки, остальные общие с исходным индексом, по
+        которому тем временем идёт поиск.
+        """
+        index = copy.copy(self)
+        index.entries, index.ranks, index.entry_tokens = list(self.entries), list(self.ranks), list(self.entry_tokens)
+        index.keys, index.max_ids = dict(self.keys), dict(self.max_ids)
+        index.short_tokens, index.short_names = dict(self.short_tokens), dict(self.short_names)
+        copied = set()
+
+        def short_lists(position):
+            # Списки коротких префиксов записи; при первом изменении список копируется.
+            lists = []
+            for kind, short, texts in (('tokens', index.short_tokens, index.entry_tokens[position]),
+                                       ('names', index.short_names, [normalize(index.entries[position]['name'])])):
+                for prefix in {prefix for text in texts for prefix in short_prefixes(text)}:
+                    if (kind, prefix) not in copied:
+                        copied.add((kind, prefix))
+                        short[prefix] = list(short.get(prefix, ()))
+                    lists.append(short[prefix])
+            return lists
+
+        rank = index.ranks.__getitem__
+        new_pairs, new_names = [], []
+        for entry in entries:
+            position = index.keys.get((entry['type'], entry['id']))
+            if position is None:
+                position = len(index.entries)
+                index.keys[entry['type'], entry['id']] = position
+                index.entries.append(entry)
+                index.ranks.append(entry_rank(entry, position))
+                index.entry_tokens.append(entry_tokens(entry))
+                index.max_ids[entry['type']] = max(index.max_id(entry['type']), entry['id'])
+                new_pairs += ((token, position) for token in index.entry_tokens[position])
+                new_names.append((normalize(entry['name']), position))
+            else:
+                if entry['weight'] == index.entries[position]['weight']:
+                    continue
+                # Вес сменился: запись переставляется в списках коротких префиксов.
+                for positions in short_lists(position):
+                    del positions[bisect_left(positions, index.ranks[position], key=rank)]
+                index.entries[position] = entry
+                index.ranks[position] = entry_rank(entry, position)
+            for positions in short_lists(position):
+                insort(positions, position, key=rank)
+        if new_pairs:
+            index.tokens, index.positions = merged(self.tokens, self.positions, new_pairs)
+        if new_names:
+            index.names, index.name_positions = merged(self.names, self.name_positions, new_names)
+        return index
+
+    def matching(self, prefix):
+        """Номера записей со словом на prefix, по рангу."""
+        return self._ranked(prefix, self.tokens, self.positions, self.short_tokens)
+
+    def starting_with(self, prefix):
+        """Номера записей, чьё название начинается с prefix, по рангу."""
+        return self._ranked(prefix, self.names, self.name_positions, self.short_names)
+
+    def _ranked(self, prefix, keys, positions, short):
+        if len(prefix) <= SHORT_PREFIX:
+            return short.get(prefix, [])
+        # Длинный префикс выбирает узкий диапазон, его проще отсортировать на месте.
+        i = bisect_left(keys, prefix)
+        j = bisect_left(keys, prefix + chr(0x10ffff), lo=i)
+        return sorted(set(positions[i:j]), key=self.ranks.__getitem__)
+
+    def search(self, query, limit=10):
+        words = tokenize(query)
+        if not words:
+            return []
+
+        def matches(position):
+            tokens = self.entry_tokens[position]
+            return all(any(token.startswith(word) for token in tokens) for word in words)
+
+        # Выше те, чьё название начинается с запроса, дальше — по рангу.
+        # Оба списка идут по рангу, поэтому хватает первых limit подходящих.
+        head = normalize(query).strip()
+        best = list(islice((
+            position for position in islice(self.starting_with(head), SCAN_LIMIT) if matches(position)
+        ), limit))
+        seen = set(best)
+        # Кандидатов даёт самое избирательное слово, остальные проверяются
+        # по словам записи.
+        candidates = min((self.matching(word) for word in set(words)), key=len)
+        best += islice((
+            position for position in islice(candidates, SCAN_LIMIT)
+            if position not in seen and matches(position)
+        ), limit - len(best))
+        return [
+            {key: value for key, value in self.entries[position].items() if key != 'weight'}
+            for position in best
+        ]
+
+
+def merged(keys, positions, pairs):
+    """
+    Массивы с вставленными парами (слово, номер). Номера новых записей больше
+    известных, поэтому пара встаёт за равными словами; массивы собираются
+    срезами.
+    """
+    merged_keys, merged_positions, start = [], [], 0
+    for key, position in sorted(pairs):
+        end = bisect_right(keys, key, lo=start)
+        merged_keys += keys[start:end]
+        merged_keys.append(key)
+        merged_positions += positions[start:end]
+        merged_positions.append(position)
+        start = end
+    return merged_keys + keys[start:], merged_positions + positions[start:]
+
+
+def load_products(after_id=0):
+    products = Product.objects.filter(id__gt=after_id).annotate(
+        weight=Count('product_infos', filter=Q(product_infos__quantity__gt=0)),
+    ).values_list('id', 'name', 'category__name', 'weight')
+    return [
+        {'type': 'product', 'id': pk, 'name': name, 'category': category, 'weight': weight}
+        for pk, name, category, weight in products
+    ]
+
+
+def load_product_weights(since):
+    """
+    {product_id: число магазинов с товаром в наличии} для продуктов, чьи
+    строки ProductInfo изменились после номера ленты since.
+    """
+    changed = ProductInfo.objects.filter(id__in=feed_since(since).values('product_info_id'))
+    return dict(ProductInfo.objects.filter(product_id__in=changed.values('product_id')).values(
+        'product_id').annotate(weight=Count('id', filter=Q(quantity__gt=0))).values_list('product_id', 'weight'))
+
+
+def load_categories(after_product_id=None, after_id=0):
+    """Все категории или только новые и те, куда добавились продукты."""
+    categories = Category.objects.all()
+    if after_product_id is not None:
+        categories = categories.filter(
+            Q(id__gt=after_id)
+            | Q(id__in=Product.objects.filter(id__gt=after_product_id).values('category_id'))
+        )
+    categories = categories.annotate(weight=Count('products')).values_list('id', 'name', 'weight')
+    return [{'type': 'category', 'id': pk, 'name': name, 'weight': weight} for pk, name, weight in categories]
+
+
+def feed_since(since):
+    """
+    Записи ленты ProductInfoChange после номера since. Ещё не пронумерованные
+    (удаления пишет триггер) тоже: номер они получат больше since.
+    """
+    return ProductInfoChange.objects.filter(Q(seq__gt=since) | Q(seq__isnull=True))
+
+
+def feed_has_deletions(since):
+    """Есть ли в ленте после since строки ProductInfo, которых уже нет."""
+    return feed_since(since).filter(
+        ~Exists(ProductInfo.objects.filter(id=OuterRef('product_info_id'))),
+    ).exists()
+
+
+def feed_position():
+    """Номер последнего изменения в ленте ProductInfoChange."""
+    return ProductInfoChange.objects.aggregate(seq=Max('seq'))['seq'] or 0
+
+
+class Autocomplete:
+    """
+    Индекс подсказок в памяти процесса. Запрос к нему не ходит в БД: версия
+    индекса берётся из кэша, и если импорт её сменил, индекс обновляется в
+    фоне, а до тех пор отвечает прежний.
+    """
+
+    def __init__(self):
+        self.index = None
+        self.version = None
+        # Номер ленты ProductInfoChange, по который учтены веса.
+        self.seq = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def search(self, query, limit=10):
+        version = autocomplete_version()
+        if self.index is None:
+            self.refresh(version)
+        elif version != self.version:
+            self.refresh_in_background(version)
+        return self.index.search(query, limit)
+
+    def warm(self):
+        """Строит индекс при старте процесса, не задерживая его запуск."""
+        self.refresh_in_background(autocomplete_version())
+
+    def refresh_in_background(self, version):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_and_close, args=(version,), daemon=True).start()
+
+    def _refresh_and_close(self, version):
+        try:
+            self.refresh(version)
+        finally:
+            with self._lock:
+                self._refreshing = False
+            connection.close()
+
+    def refresh(self, version):
+        """
+        Импорт продукты не переименовывает и не удаляет, а только добавляет:
+        новые продукты дочитываются по id больше известных. Вес (наличие)
+        перечитывается только у продуктов, чьи строки ProductInfo попали в
+        ленту изменений после прошлого обновления, и вливается в индекс. Если
+        в ленте есть удалённые строки (удаление из админки) или записей
+        изменилось больше PATCH_LIMIT, индекс строится заново. Продукт без
+        предложений, удалённый из админки, уйдёт из подсказок при пересборке.
+        """
+        index, since = self.index, self.seq
+        seq = feed_position()
+        if index is not None and feed_has_deletions(since):
+            index = None
+        if index is not None:
+            changed = []
+            for product_id, weight in load_product_weights(since).items():
+                position = index.keys.get(('product', product_id))
+                if position is not None and index.entries[position]['weight'] != weight:
+                    changed.append({**index.entries[position], 'weight': weight})
+            added = load_products(after_id=index.max_id('product'))
+            if added:
+                changed += added + load_categories(index.max_id('product'), index.max_id('category'))
+            index = index.patched(changed) if len(changed) <= PATCH_LIMIT else None
+        if index is None:
+            index = PrefixIndex(load_products() + load_categories())
+        self.index, self.seq, self.version = index, seq, version
+
+
+autocomplete = Autocomplete()
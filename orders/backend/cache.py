@@ -0,0 +1,114 @@
+import hashlib
+import threading
+import uuid
+from collections import Counter
+
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .etags import conditional_response
+
+CATALOG_CACHE = 'catalog'
+
+# Счётчики попаданий/промахов кэша каталога в этом процессе.
+stats = Counter()
+_stats_lock = threading.Lock()
+
+
+AUTOCOMPLETE_VERSION_KEY = 'catalog:version:autocomplete'
+
+
+def _version_key(shop_id):
+    return f'catalog:version:{shop_id if shop_id is not None else "all"}'
+
+
+def _version(key):
+    cache = caches[CATALOG_CACHE]
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def catalog_version(shop_id=None):
+    """
+    Текущая версия каталога (всего или одного магазина). Версия — случайный
+    токен, а не счётчик: если кэш вытеснит ключ версии, новая версия не
+    совпадёт ни с одной старой и устаревшие ответы не оживут.
+    """
+    return _version(_version_key(shop_id))
+
+
+def bump_catalog_version(shop_id=None, shop_only=False):
+    """
+    Новая версия каталога магазина и всего каталога. shop_only — только
+    магазина: так меняются остатки при оформлении и отмене заказов, и
+    общие списки не сбрасываются на каждый заказ (остатки в них догонят
+    при следующем импорте или по таймауту кэша).
+    """
+    cache = caches[CATALOG_CACHE]
+    versions = {} if shop_only and shop_id is not None else {_version_key(None): uuid.uuid4().hex}
+    if shop_id is not None:
+        versions[_version_key(shop_id)] = uuid.uuid4().hex
+    cache.set_many(versions, None)
+
+
+def autocomplete_version():
+    """Версия индекса подсказок: её меняет только импорт прайсов."""
+    return _version(AUTOCOMPLETE_VERSION_KEY)
+
+
+def bump_autocomplete_version():
+    caches[CATALOG_CACHE].set(AUTOCOMPLETE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def normalized_query(request):
+    params = request.query_params
+    return '&'.join(f'{key}={value}' for key in sorted(params) for value in sorted(params.getlist(key)))
+
+
+def record(outcome):
+    with _stats_lock:
+        stats[outcome] += 1
+
+
+class CatalogCacheMixin:
+    """
+    Кэш ответов GET каталога. Ключ — путь, нормализованный query string и
+    версия каталога; импорт меняет версию, и старые ключи просто перестают
+    запрашиваться (их вытеснит LRU бэкенда). Вместе с телом хранится ETag
+    ответа, так что условный запрос к закэшированному ответу получает 304.
+    """
+
+    def get_catalog_shop_id(self):
+        return None
+
+    def get_catalog_version(self):
+        return catalog_version(self.get_catalog_shop_id())
+
+    def get_catalog_cache_key(self, request):
+        version = self.get_catalog_version()
+        url = f'{request.get_host()}{request.path}?{normalized_query(request)}'
+        digest = hashlib.md5(url.encode()).hexdigest()
+        return f'catalog:response:{version}:{digest}'
+
+    def get(self, request, *args, **kwargs):
+        cache = caches[CATALOG_CACHE]
+        key = self.get_catalog_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            record('hits')
+            data, etag = cached
+            response = conditional_response(request, etag) if etag else None
+            if response is None:
+                response = Response(data, headers={'ETag': etag} if etag else None)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        record('misses')
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, (response.data, response.get('ETag')))
+        response['X-Cache'] = 'MISS'
+        return response
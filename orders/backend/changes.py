@@ -0,0 +1,79 @@
+from django.db import connection, transaction
+
+from .models import ProductInfo, ProductInfoChange
+
+# Ключ pg_advisory_xact_lock нумерации ленты изменений.
+CHANGE_FEED_LOCK = 0x6e66_0002
+
+# Нумерует закоммиченные записи без номера. Под блокировкой номера
+# выдаются по одной транзакции за раз, и читатель никогда не увидит
+# номер больше того, что ещё может появиться.
+SEQUENCE_CHANGES_SQL = '''
+    -- MATERIALIZED: номера выдаются один раз и в порядке id. Подзапрос во
+    -- FROM план мог бы пересканировать во вложенном цикле, вызывая nextval
+    -- заново и раздавая номера в порядке соединения.
+    WITH pending AS MATERIALIZED (
+        SELECT id, nextval('backend_productinfochange_seq') AS seq
+        FROM (SELECT id FROM backend_productinfochange WHERE seq IS NULL ORDER BY id) AS ordered
+    )
+    UPDATE backend_productinfochange AS change
+    SET seq = pending.seq
+    FROM pending
+    WHERE change.id = pending.id
+    RETURNING change.product_info_id
+'''
+
+# Лента компактная: от строки остаётся только последняя запись.
+COMPACT_CHANGES_SQL = '''
+    DELETE FROM backend_productinfochange AS change
+    USING backend_productinfochange AS newer
+    WHERE change.product_info_id = ANY(%s)
+      AND newer.product_info_id = change.product_info_id
+      AND newer.seq > change.seq
+'''
+
+CHANGE_VALUES = ('id', 'shop_id', 'product_id', 'name', 'price', 'price_rrc', 'quantity', 'params')
+
+
+def record_changes(info_ids):
+    """Отмечает строки ProductInfo изменёнными; номер они получат после коммита."""
+    info_ids = list(info_ids)
+    if info_ids:
+        ProductInfoChange.objects.bulk_create([ProductInfoChange(product_info_id=pk) for pk in info_ids])
+        transaction.on_commit(sequence_changes)
+
+
+def sequence_changes():
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHANGE_FEED_LOCK])
+        cursor.execute(SEQUENCE_CHANGES_SQL)
+        info_ids = [row[0] for row in cursor.fetchall()]
+        if info_ids:
+            cursor.execute(COMPACT_CHANGES_SQL, [info_ids])
+
+
+def changes_since(since, limit):
+    """
+    Изменения с номером больше since: текущее состояние строки или
+    {'deleted': True}, если строки больше нет. Возвращает (изменения, есть ли ещё).
+    """
+    if ProductInfoChange.objects.filter(seq__isnull=True).exists():
+        # Удаления записывает триггер (миграция 0020) без нумерации после
+        # коммита; процесс мог и упасть между коммитом и нумерацией —
+        # нумеруем оставшиеся записи.
+        sequence_changes()
+    entries = list(ProductInfoChange.objects.filter(seq__gt=since).order_by('seq').values_list(
+        'seq', 'product_info_id')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    rows = {row['id']: row for row in ProductInfo.objects.filter(
+        id__in=[pk for _, pk in entries]).values(*CHANGE_VALUES)}
+    changes = []
+    for seq, pk in entries:
+        row = rows.get(pk)
+        if row is None:
+            changes.append({'seq': seq, 'id': pk, 'deleted': True})
+        else:
+            # Цены строками, как в остальных ответах API
+            changes.append({'seq': seq, **row, 'price': str(row['price']), 'price_rrc': str(row['price_rrc'])})
+    return changes, has_more
@@ -0,0 +1,30 @@
+import hashlib
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    """
+    Строгий ETag из версий строк, а не из тела ответа: версии известны
+    до сериализации, поэтому 304 отдаётся без неё.
+    """
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def etag_matches(request, etag):
+    # If-None-Match сравнивается слабо (RFC 9110, 13.1.2): W/"x" совпадает с "x".
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+
+def conditional_response(request, etag):
+    """Ответ 304, если у клиента актуальная версия, иначе None."""
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return None
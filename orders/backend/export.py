@@ -0,0 +1,79 @@
+import csv
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import ProductInfo
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+EXPORT_COLUMNS = ('id', 'product_id', 'product', 'category', 'shop', 'model', 'price', 'price_rrc', 'quantity',
+                  'parameters', 'updated_at')
+
+EXPORT_VALUES = {
+    'id': 'id', 'product_id': 'product_id', 'product': 'product__name', 'category': 'product__category__name',
+    'shop': 'shop__name', 'model': 'name', 'price': 'price', 'price_rrc': 'price_rrc', 'quantity': 'quantity',
+    'parameters': 'params', 'updated_at': 'updated_at',
+}
+
+
+def parse_changed_since(value):
+    """ISO 8601 дата или дата-время; без зоны — в текущей зоне проекта. None, если не разобрать."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_queryset(shop_id=None, changed_since=None):
+    queryset = ProductInfo.objects.order_by('id')
+    if shop_id is not None:
+        queryset = queryset.filter(shop_id=shop_id)
+    if changed_since is not None:
+        queryset = queryset.filter(updated_at__gte=changed_since)
+    return queryset.values_list(*EXPORT_VALUES.values())
+
+
+def export_rows(queryset, chunk_size=2000):
+    """
+    Строки выгрузки по одной. iterator() на PostgreSQL читает через
+    серверный курсор пачками по chunk_size, так что память не зависит от
+    размера каталога.
+    """
+    for values in queryset.iterator(chunk_size=chunk_size):
+        row = dict(zip(EXPORT_COLUMNS, values))
+        row['parameters'] = {item['parameter']['name']: item['value'] for item in row['parameters']}
+        row['updated_at'] = row['updated_at'].isoformat()
+        yield row
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    # csv.writer пишет строку в "файл" и сразу получает её обратно.
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        row['parameters'] = json.dumps(row['parameters'], ensure_ascii=False)
+        yield writer.writerow(row[column] for column in EXPORT_COLUMNS)
+
+
+def export_lines(export_format, rows):
+    return ndjson_lines(rows) if export_format == 'ndjson' else csv_lines(rows)
@@ -0,0 +1,111 @@
+import re
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Q, Sum
+
+from .models import ParameterFacet
+
+PARAM_QUERY_RE = re.compile(r'^param\[(.+)\]$')
+
+# Прибавляет (sign=1) или вычитает (sign=-1) параметры строк из счётчиков.
+FACET_DELTA_SQL = '''
+    INSERT INTO backend_parameterfacet (shop_id, parameter_id, value, count)
+    SELECT pi.shop_id, pp.parameter_id, pp.value, %s * count(*)
+    FROM backend_productparameter AS pp
+    JOIN backend_productinfo AS pi ON pi.id = pp.product_info_id
+    WHERE pi.id = ANY(%s)
+    GROUP BY pi.shop_id, pp.parameter_id, pp.value
+    ON CONFLICT (shop_id, parameter_id, value)
+    DO UPDATE SET count = backend_parameterfacet.count + EXCLUDED.count
+    RETURNING id, count
+'''
+
+# Группировка значений из ProductInfo.params по строкам выдачи (подзапрос).
+RESULT_FACETS_SQL = '''
+    SELECT item -> 'parameter' ->> 'name', item ->> 'value', count(*)
+    FROM ({}) AS result, jsonb_array_elements(result.params) AS item
+    GROUP BY 1, 2
+'''
+
+REBUILD_FACETS_SQL = '''
+    INSERT INTO backend_parameterfacet (shop_id, parameter_id, value, count)
+    SELECT pi.shop_id, pp.parameter_id, pp.value, count(*)
+    FROM backend_productparameter AS pp
+    JOIN backend_productinfo AS pi ON pi.id = pp.product_info_id
+    WHERE pi.shop_id = %s
+    GROUP BY pi.shop_id, pp.parameter_id, pp.value
+'''
+
+
+def _apply_delta(info_ids, sign):
+    info_ids = list(info_ids)
+    if not info_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(FACET_DELTA_SQL, [sign, info_ids])
+        # Обнулившиеся значения — только среди затронутых этой дельтой, по pk.
+        emptied = [pk for pk, count in cursor.fetchall() if count <= 0]
+    if emptied:
+        ParameterFacet.objects.filter(pk__in=emptied, count__lte=0).delete()
+
+
+def remove_from_facets(info_ids):
+    """Вычитает текущие параметры строк; вызывается до их перезаписи."""
+    _apply_delta(info_ids, -1)
+
+
+def add_to_facets(info_ids):
+    """Прибавляет параметры строк; вызывается после их записи."""
+    _apply_delta(info_ids, 1)
+
+
+def rebuild_facets(shop_id):
+    """Пересчитывает счётчики магазина целиком (построчный импорт)."""
+    ParameterFacet.objects.filter(shop_id=shop_id).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_FACETS_SQL, [shop_id])
+
+
+def parameter_filters(query_params):
+    """?param[Цвет]=черный&param[Цвет]=белый -> {'Цвет': ['черный', 'белый']}"""
+    filters = {}
+    for key in query_params:
+        match = PARAM_QUERY_RE.match(key)
+        if match:
+            filters[match.group(1)] = query_params.getlist(key)
+    return filters
+
+
+def filter_by_parameters(queryset, filters):
+    # params @> [{...}] по GIN-индексу; значения одного параметра — через ИЛИ,
+    # разные параметры — через И.
+    for name, values in filters.items():
+        condition = Q()
+        for value in values:
+            condition |= Q(params__contains=[{'parameter': {'name': name}, 'value': value}])
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def facet_counts(queryset, shop_id=None, filtered=False):
+    """
+    Счётчики значений параметров для выдачи. Без фильтров по параметрам и
+    поиску — готовые счётчики ParameterFacet; иначе группировка
+    ProductInfo.params только по строкам отфильтрованной выдачи.
+    """
+    if filtered:
+        sql, params = queryset.order_by().values('params').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(RESULT_FACETS_SQL.format(sql), params)
+            rows = cursor.fetchall()
+    else:
+        facets = ParameterFacet.objects.all()
+        if shop_id is not None:
+            facets = facets.filter(shop_id=shop_id)
+        rows = facets.values_list('parameter__name', 'value').annotate(total=Sum('count'))
+
+    grouped = defaultdict(list)
+    for name, value, total in sorted(rows, key=lambda row: (row[0], -row[2], row[1])):
+        grouped[name].append({'value': value, 'count': total})
+    return [{'name': name, 'values': values} for name, values in grouped.items()]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:59
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_shop_feed_validators'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_text',
+            field=models.TextField(blank=True, default='', verbose_name='Текст для поиска'),
+        ),
+        migrations.RunSQL(
+            sql='''
+                UPDATE backend_productinfo AS pi
+                SET search_text = concat_ws(' ', p.name, pi.name, (
+                    SELECT string_agg(pp.value, ' ' ORDER BY pp.id)
+                    FROM backend_productparameter AS pp
+                    WHERE pp.product_info_id = pi.id
+                ))
+                FROM backend_product AS p
+                WHERE p.id = pi.product_id
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('search_text', config='russian'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='productinfo_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_text'], name='productinfo_search_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
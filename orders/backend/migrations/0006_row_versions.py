@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:05
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_order_user_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunSQL(
+            sql='CREATE SEQUENCE backend_productinfo_version_seq',
+            reverse_sql='DROP SEQUENCE backend_productinfo_version_seq',
+        ),
+        # Существующие строки получают версии из DEFAULT nextval(...) при добавлении столбца.
+        migrations.AddField(
+            model_name='productinfo',
+            name='version',
+            field=models.BigIntegerField(db_default=django.db.models.expressions.RawSQL("nextval('backend_productinfo_version_seq')", [], output_field=models.BigIntegerField()), verbose_name='Версия строки'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_row_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество товаров')),
+            ],
+            options={
+                'verbose_name': 'Счётчик значения параметра',
+                'verbose_name_plural': 'Счётчики значений параметров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value'], name='productparameter_value'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.parameter', verbose_name='Параметр'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddConstraint(
+            model_name='parameterfacet',
+            constraint=models.UniqueConstraint(fields=('shop', 'parameter', 'value'), name='unique_parameter_facet'),
+        ),
+        migrations.RunSQL(
+            sql='''
+                INSERT INTO backend_parameterfacet (shop_id, parameter_id, value, count)
+                SELECT pi.shop_id, pp.parameter_id, pp.value, count(*)
+                FROM backend_productparameter AS pp
+                JOIN backend_productinfo AS pi ON pi.id = pp.product_info_id
+                GROUP BY pi.shop_id, pp.parameter_id, pp.value
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
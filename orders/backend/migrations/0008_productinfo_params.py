@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:09
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_parameter_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='params',
+            field=models.JSONField(blank=True, default=list, verbose_name='Параметры (копия)'),
+        ),
+        migrations.RunSQL(
+            sql='''
+                UPDATE backend_productinfo AS pi
+                SET params = coalesce((
+                    SELECT jsonb_agg(jsonb_build_object(
+                        'parameter', jsonb_build_object('name', p.name), 'value', pp.value
+                    ) ORDER BY pp.id)
+                    FROM backend_productparameter AS pp
+                    JOIN backend_parameter AS p ON p.id = pp.parameter_id
+                    WHERE pp.product_info_id = pi.id
+                ), '[]'::jsonb)
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['params'], name='productinfo_params', opclasses=['jsonb_path_ops']),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_productinfo_params'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestOffer',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='best_offer', serialize=False, to='backend.product', verbose_name='Продукт')),
+                ('product_name', models.CharField(max_length=100, verbose_name='Название продукта')),
+                ('shop_name', models.CharField(max_length=100, verbose_name='Название магазина')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Минимальная цена')),
+                ('total_quantity', models.PositiveIntegerField(verbose_name='Суммарный остаток')),
+                ('offer_count', models.PositiveIntegerField(verbose_name='Количество предложений')),
+                ('product_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.productinfo', verbose_name='Предложение')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Лучшее предложение',
+                'verbose_name_plural': 'Лучшие предложения',
+            },
+        ),
+        migrations.RunSQL(
+            sql='''
+                INSERT INTO backend_bestoffer (
+                    product_id, product_name, product_info_id, shop_id, shop_name, price, total_quantity, offer_count
+                )
+                SELECT DISTINCT ON (pi.product_id)
+                    pi.product_id, p.name, pi.id, pi.shop_id, s.name, pi.price,
+                    sum(pi.quantity) OVER product_offers, count(*) OVER product_offers
+                FROM backend_productinfo AS pi
+                JOIN backend_product AS p ON p.id = pi.product_id
+                JOIN backend_shop AS s ON s.id = pi.shop_id
+                WHERE pi.quantity > 0
+                WINDOW product_offers AS (PARTITION BY pi.product_id)
+                ORDER BY pi.product_id, pi.price, pi.id
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
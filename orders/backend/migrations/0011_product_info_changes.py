@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_productinfo_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductInfoChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(null=True, unique=True, verbose_name='Номер изменения')),
+                ('product_info_id', models.BigIntegerField(verbose_name='Информация о продукте')),
+            ],
+            options={
+                'verbose_name': 'Изменение информации о продукте',
+                'verbose_name_plural': 'Изменения информации о продуктах',
+                'indexes': [models.Index(fields=['product_info_id', 'seq'], name='productinfochange_info_seq'), models.Index(condition=models.Q(('seq__isnull', True)), fields=['id'], name='productinfochange_pending')],
+            },
+        ),
+        migrations.RunSQL(
+            sql=[
+                'CREATE SEQUENCE backend_productinfochange_seq',
+                # Лента начинается с текущего состояния каталога.
+                '''
+                INSERT INTO backend_productinfochange (seq, product_info_id)
+                SELECT nextval('backend_productinfochange_seq'), id FROM backend_productinfo ORDER BY id
+                ''',
+            ],
+            reverse_sql='DROP SEQUENCE backend_productinfochange_seq',
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:22
+
+import backend.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='snapshot',
+            field=models.JSONField(blank=True, default=backend.models.empty_order_snapshot),
+        ),
+        # Снимки уже оформленных заказов — по текущему состоянию каталога и
+        # контактов, в формате ContactSerializer/OrderItemSerializer.
+        migrations.RunSQL(
+            sql='''
+                UPDATE backend_order AS o
+                SET snapshot = jsonb_build_object(
+                    'contact', (
+                        SELECT to_jsonb(c) - 'user_id' || jsonb_build_object('user', c.user_id)
+                        FROM backend_contact AS c
+                        WHERE c.id = o.contact_id
+                    ),
+                    'items', coalesce((
+                        SELECT jsonb_agg(jsonb_build_object(
+                            'id', oi.id,
+                            'product_info', jsonb_build_object(
+                                'id', pi.id,
+                                'product', jsonb_build_object('name', p.name, 'category', cat.name),
+                                'shop', jsonb_build_object('name', s.name),
+                                'price', pi.price::text,
+                                'quantity', pi.quantity,
+                                'product_parameters', pi.params
+                            ),
+                            'quantity', oi.quantity,
+                            'price', oi.price::text
+                        ) ORDER BY oi.id)
+                        FROM backend_orderitem AS oi
+                        JOIN backend_productinfo AS pi ON pi.id = oi.product_info_id
+                        JOIN backend_product AS p ON p.id = pi.product_id
+                        LEFT JOIN backend_category AS cat ON cat.id = p.category_id
+                        JOIN backend_shop AS s ON s.id = pi.shop_id
+                        WHERE oi.order_id = o.id
+                    ), '[]'::jsonb)
+                )
+            ''',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_order_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                # Шаг = размер блока backend.numbers.ORDER_NUMBER_BLOCK.
+                'CREATE SEQUENCE backend_order_number_seq INCREMENT BY 100',
+                # У старых заказов номеров не было: берём id, а выдачу новых
+                # начинаем за последним из них.
+                '''
+                UPDATE backend_order SET number = lpad(id::text, 8, '0')
+                WHERE number IS NULL OR number = ''
+                ''',
+                '''
+                SELECT setval('backend_order_number_seq', coalesce(max(id), 0) + 1, false) FROM backend_order
+                ''',
+            ],
+            reverse_sql='DROP SEQUENCE backend_order_number_seq',
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('number',), name='unique_order_number'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_committed_reservations'),
+    ]
+
+    operations = [
+        # Удаления ProductInfo попадают в ленту изменений одной вставкой на
+        # DELETE, а не сигналом на каждую строку: с post_delete Django не может
+        # удалять каскады одним запросом. Номера записям выдаёт
+        # backend.changes.sequence_changes.
+        migrations.RunSQL(
+            sql=[
+                '''
+                CREATE FUNCTION backend_productinfo_record_deletion() RETURNS trigger AS $$
+                BEGIN
+                    INSERT INTO backend_productinfochange (product_info_id)
+                    SELECT id FROM deleted ORDER BY id;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+                ''',
+                '''
+                CREATE TRIGGER backend_productinfo_record_deletion
+                AFTER DELETE ON backend_productinfo
+                REFERENCING OLD TABLE AS deleted
+                FOR EACH STATEMENT EXECUTE FUNCTION backend_productinfo_record_deletion()
+                ''',
+            ],
+            reverse_sql=[
+                'DROP TRIGGER backend_productinfo_record_deletion ON backend_productinfo',
+                'DROP FUNCTION backend_productinfo_record_deletion()',
+            ],
+        ),
+    ]
@@ -1,15 +1,28 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Now
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 
+from .numbers import next_order_number
+
 class User(AbstractUser):
     email_confirm_token = models.CharField(max_length=50, blank=True, null=True)
 
 class Shop(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название')
     url = models.URLField(verbose_name='Ссылка', null=True, blank=True)
+    # Учётная запись магазина: может менять цены и остатки через API.
+    user = models.OneToOneField(User, verbose_name='Пользователь', related_name='shop',
+                                null=True, blank=True, on_delete=models.SET_NULL)
+    feed_etag = models.CharField(max_length=255, blank=True, default='',
+                                 verbose_name='ETag последнего прайса')
+    feed_last_modified = models.CharField(max_length=64, blank=True, default='',
+                                          verbose_name='Last-Modified последнего прайса')
 
     class Meta:
         verbose_name = 'Магазин'
@@ -59,6 +72,24 @@ class Parameter(models.Model):
         return self.name
 
 
+PRODUCT_INFO_VERSION_SEQUENCE = 'backend_productinfo_version_seq'
+
+
+def next_product_info_version():
+    """Следующая версия строки ProductInfo (общая последовательность в БД)."""
+    return RawSQL(f"nextval('{PRODUCT_INFO_VERSION_SEQUENCE}')", [], output_field=models.BigIntegerField())
+
+
+def product_info_changes():
+    """Значения, которые выставляются при любом изменении строки ProductInfo."""
+    return {'version': next_product_info_version(), 'updated_at': Now()}
+
+
+def product_info_params(parameters):
+    """{'Цвет': 'черный'} из прайса -> значение ProductInfo.params."""
+    return [{'parameter': {'name': name}, 'value': str(value)} for name, value in parameters.items()]
+
+
 class ProductInfo(models.Model):
     product = models.ForeignKey(Product, verbose_name='Продукт', related_name='product_infos',
                                 on_delete=models.CASCADE)
@@ -72,6 +103,22 @@ class ProductInfo(models.Model):
                                     validators=[MinValueValidator(0)])
     parameters = models.ManyToManyField(Parameter, through='ProductParameter',
                                         verbose_name='Параметры', related_name='product_infos')
+    fingerprint = models.CharField(max_length=32, blank=True, default='',
+                                   verbose_name='Отпечаток содержимого прайса')
+    # Название продукта, модель и значения параметров одной строкой;
+    # заполняется backend.search.refresh_search_text после записи строки.
+    search_text = models.TextField(blank=True, default='', verbose_name='Текст для поиска')
+    search_vector = models.GeneratedField(
+        expression=SearchVector('search_text', config='russian'),
+        output_field=SearchVectorField(), db_persist=True,
+    )
+    # Берётся из последовательности при вставке и при каждой записи цены,
+    # остатка или параметров; из неё строятся ETag ответов каталога.
+    version = models.BigIntegerField(db_default=next_product_info_version(), verbose_name='Версия строки')
+    updated_at = models.DateTimeField(db_default=Now(), verbose_name='Изменено', db_index=True)
+    # Копия ProductParameter в формате ответа API: [{"parameter": {"name": ...}, "value": ...}].
+    # Пишется импортом вместе со строкой; каталог читает и фильтрует только её.
+    params = models.JSONField(default=list, blank=True, verbose_name='Параметры (копия)')
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -79,11 +126,36 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop'], name='unique_product_info')
         ]
+        indexes = [
+            GinIndex(fields=['search_vector'], name='productinfo_search_vector'),
+            GinIndex(fields=['search_text'], name='productinfo_search_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['params'], name='productinfo_params', opclasses=['jsonb_path_ops']),
+        ]
 
     def __str__(self):
         return f'{self.product.name} ({self.shop.name})'
 
 
+class ProductInfoChange(models.Model):
+    """
+    Лента изменений ProductInfo (backend.changes). Запись добавляется в той
+    же транзакции, что и изменение, с пустым seq; номер выдаётся после
+    коммита под блокировкой, поэтому seq растёт в порядке коммитов. Для
+    каждой строки хранится только последняя запись.
+    """
+    seq = models.BigIntegerField(null=True, unique=True, verbose_name='Номер изменения')
+    # Без внешнего ключа: запись переживает удаление строки и сообщает о нём.
+    product_info_id = models.BigIntegerField(verbose_name='Информация о продукте')
+
+    class Meta:
+        verbose_name = 'Изменение информации о продукте'
+        verbose_name_plural = 'Изменения информации о продуктах'
+        indexes = [
+            models.Index(fields=['product_info_id', 'seq'], name='productinfochange_info_seq'),
+            models.Index(fields=['id'], name='productinfochange_pending', condition=models.Q(seq__isnull=True)),
+        ]
+
+
 class ProductParameter(models.Model):
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте',
                                      related_name='product_parameters', on_delete=models.CASCADE)
@@ -97,11 +169,64 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter')
         ]
+        indexes = [
+            # Фильтр каталога по значению параметра
+            models.Index(fields=['parameter', 'value'], name='productparameter_value'),
+        ]
 
     def __str__(self):
         return f'{self.parameter.name} - {self.value}'
 
 
+class ParameterFacet(models.Model):
+    """
+    Сколько товаров магазина имеют данное значение параметра. Ведётся
+    импортом (backend.facets), чтобы боковая панель фильтров читала готовые
+    счётчики, а не группировала ProductParameter.
+    """
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='facets', on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='facets',
+                                  on_delete=models.CASCADE)
+    value = models.CharField(max_length=100, verbose_name='Значение')
+    count = models.IntegerField(default=0, verbose_name='Количество товаров')
+
+    class Meta:
+        verbose_name = 'Счётчик значения параметра'
+        verbose_name_plural = 'Счётчики значений параметров'
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'parameter', 'value'], name='unique_parameter_facet')
+        ]
+
+    def __str__(self):
+        return f'{self.parameter.name} - {self.value}: {self.count}'
+
+
+class BestOffer(models.Model):
+    """
+    Лучшее предложение по продукту среди магазинов, где он есть в наличии:
+    минимальная цена, её магазин, суммарный остаток и число предложений.
+    Пересчитывается импортом для затронутых продуктов (backend.offers);
+    названия скопированы, чтобы /products/best-offers/ читал только эту таблицу.
+    """
+    product = models.OneToOneField(Product, verbose_name='Продукт', related_name='best_offer',
+                                   primary_key=True, on_delete=models.CASCADE)
+    product_name = models.CharField(max_length=100, verbose_name='Название продукта')
+    product_info = models.ForeignKey(ProductInfo, verbose_name='Предложение', related_name='+',
+                                     on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='+', on_delete=models.CASCADE)
+    shop_name = models.CharField(max_length=100, verbose_name='Название магазина')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Минимальная цена')
+    total_quantity = models.PositiveIntegerField(verbose_name='Суммарный остаток')
+    offer_count = models.PositiveIntegerField(verbose_name='Количество предложений')
+
+    class Meta:
+        verbose_name = 'Лучшее предложение'
+        verbose_name_plural = 'Лучшие предложения'
+
+    def __str__(self):
+        return f'{self.product_name}: {self.price} ({self.shop_name})'
+
+
 class Order(models.Model):
     class StatusChoices(models.TextChoices):
         BASKET = 'basket', _('Корзина')
@@ -194,6 +319,9 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+def empty_order_snapshot():
+    return {'contact': None, 'items': []}
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('new', 'Новый'),
@@ -202,12 +330,52 @@ class Order(models.Model):
         ('delivered', 'Доставлен'),
         ('canceled', 'Отменён'),
     ]
+    # Допустимые переходы статусов; delivered и canceled — конечные.
+    TRANSITIONS = {
+        'new': ('processing', 'canceled'),
+        'processing': ('shipped', 'canceled'),
+        'shipped': ('delivered',),
+        'delivered': (),
+        'canceled': (),
+    }
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     contact = models.ForeignKey(Contact, on_delete=models.SET_NULL, null=True)
     number = models.CharField(max_length=50, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='new')
+    version = models.PositiveIntegerField(default=1)
+    # Позиции и контакт в том виде, в каком их отдаёт API, на момент
+    # оформления: чтение заказа не ходит в каталог, и ответ не меняется
+    # вслед за ценами и контактами.
+    snapshot = models.JSONField(default=empty_order_snapshot, blank=True)
+
+    class Meta:
+        indexes = [
+            # Ключ курсорной пагинации списка заказов пользователя
+            models.Index(fields=['user', '-id'], name='order_user_id_desc'),
+            # Кандидаты в архив (backend.archive) без просмотра живых заказов
+            models.Index(fields=['id'], name='order_terminal_id',
+                         condition=models.Q(status__in=('delivered', 'canceled'))),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['number'], name='unique_order_number'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is None and not self.number:
+            self.number = next_order_number()
+        # Версия для ETag: увеличивается в базе, чтобы параллельные
+        # сохранения не получили одну и ту же версию.
+        update_fields = kwargs.get('update_fields')
+        bump = self.pk is not None and not kwargs.get('force_insert')
+        if bump:
+            self.version = models.F('version') + 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -221,3 +389,87 @@ class OrderStatusHistory(models.Model):
     changed_at = models.DateTimeField(auto_now_add=True)
     note = models.TextField(blank=True)
 
+
+class StockReservation(models.Model):
+    """
+    Остаток, списанный под заказ. Пока заказ новый, резерв живёт до
+    expires_at; просроченные резервы возвращаются на склад
+    (backend.reservations.release_expired_reservations). У заказа в
+    обработке резерв бессрочный (expires_at пуст), но при отмене остаток
+    возвращается; после отгрузки резерв удаляется.
+    """
+    order = models.ForeignKey(Order, related_name='reservations', on_delete=models.CASCADE)
+    product_info = models.ForeignKey(ProductInfo, related_name='reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True, null=True, blank=True)
+
+
+# --- Archive ---
+# Заказы в конечных статусах, перенесённые из Order/OrderItem/OrderStatusHistory
+# (backend.archive). id сохраняются, внешних ключей на каталог и контакты нет:
+# заказ читается из снимка.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    contact_id = models.BigIntegerField(null=True)
+    number = models.CharField(max_length=50, blank=True, null=True)
+    created_at = models.DateTimeField()
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    status = models.CharField(max_length=50, choices=Order.STATUS_CHOICES)
+    version = models.PositiveIntegerField(default=1)
+    snapshot = models.JSONField(default=empty_order_snapshot, blank=True)
+    archived_at = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'], name='archivedorder_user_id_desc'),
+        ]
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='items', on_delete=models.CASCADE)
+    product_info_id = models.BigIntegerField()
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+class ArchivedOrderStatusHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='status_history', on_delete=models.CASCADE)
+    status = models.CharField(max_length=50)
+    changed_at = models.DateTimeField()
+    note = models.TextField(blank=True)
+
+
+# --- Sales rollups ---
+# Продажи (заказы, кроме отменённых) по дням; ведутся приращениями при
+# оформлении и отмене заказа (backend.rollups), отчёты читают только их.
+class ShopDailySales(models.Model):
+    day = models.DateField()
+    shop = models.ForeignKey(Shop, related_name='+', on_delete=models.CASCADE)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'day'], name='unique_shop_daily_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='shopdailysales_day'),
+        ]
+
+class ProductDailySales(models.Model):
+    day = models.DateField()
+    shop = models.ForeignKey(Shop, related_name='+', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'product', 'day'], name='unique_product_daily_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'shop'], name='productdailysales_day_shop'),
+        ]
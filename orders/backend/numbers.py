@@ -0,0 +1,58 @@
+import os
+import threading
+
+from django.db import connection
+
+# Шаг последовательности номеров заказов (см. миграцию 0015): каждый
+# nextval отдаёт начало очередного блока из ORDER_NUMBER_BLOCK номеров.
+# Менять только вместе с ALTER SEQUENCE ... INCREMENT BY.
+ORDER_NUMBER_SEQUENCE = 'backend_order_number_seq'
+ORDER_NUMBER_BLOCK = 100
+
+
+class HiLoSequence:
+    """
+    Блочная (hi/lo) выдача номеров. Процесс забирает у последовательности
+    PostgreSQL блок номеров одним nextval и раздаёт его из памяти, так что
+    оформления не ждут друг друга в базе. Блоки разных процессов не
+    пересекаются; номера уникальны, но с пропусками — недоданный остаток
+    блока теряется при перезапуске процесса.
+    """
+
+    def __init__(self, sequence, block_size):
+        self.sequence = sequence
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Забыть текущий блок; следующий номер возьмёт новый."""
+        self._pid = os.getpid()
+        self._next = self._limit = 0
+
+    def _fetch_block(self):
+        # nextval не откатывается вместе с транзакцией, поэтому блок остаётся
+        # за процессом, даже если заказ, ради которого его взяли, не создан.
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s)', [self.sequence])
+            start = cursor.fetchone()[0]
+        self._next, self._limit = start, start + self.block_size
+
+    def next(self):
+        with self._lock:
+            # После fork потомок унаследовал бы блок родителя — берём свой.
+            if self._pid != os.getpid():
+                self.reset()
+            if self._next >= self._limit:
+                self._fetch_block()
+            value = self._next
+            self._next += 1
+            return value
+
+
+order_numbers = HiLoSequence(ORDER_NUMBER_SEQUENCE, ORDER_NUMBER_BLOCK)
+
+
+def next_order_number():
+    """Номер заказа для людей: восемь цифр с ведущими нулями."""
+    return f'{order_numbers.next():08d}'
@@ -0,0 +1,67 @@
+from django.db import connection, transaction
+
+from .cache import bump_catalog_version
+
+# Пересчёт лучших предложений для заданных продуктов: по одной строке на
+# продукт, у которого есть предложения в наличии. Цена ниже — лучше, при
+# равной цене выигрывает более раннее предложение.
+REFRESH_BEST_OFFERS_SQL = '''
+    INSERT INTO backend_bestoffer (
+        product_id, product_name, product_info_id, shop_id, shop_name, price, total_quantity, offer_count
+    )
+    SELECT DISTINCT ON (pi.product_id)
+        pi.product_id, p.name, pi.id, pi.shop_id, s.name, pi.price,
+        sum(pi.quantity) OVER product_offers, count(*) OVER product_offers
+    FROM backend_productinfo AS pi
+    JOIN backend_product AS p ON p.id = pi.product_id
+    JOIN backend_shop AS s ON s.id = pi.shop_id
+    WHERE pi.product_id = ANY(%(products)s) AND pi.quantity > 0
+    WINDOW product_offers AS (PARTITION BY pi.product_id)
+    ORDER BY pi.product_id, pi.price, pi.id
+    ON CONFLICT (product_id) DO UPDATE SET
+        product_name = EXCLUDED.product_name,
+        product_info_id = EXCLUDED.product_info_id,
+        shop_id = EXCLUDED.shop_id,
+        shop_name = EXCLUDED.shop_name,
+        price = EXCLUDED.price,
+        total_quantity = EXCLUDED.total_quantity,
+        offer_count = EXCLUDED.offer_count
+'''
+
+# Продукты, которых больше нет в наличии ни в одном магазине.
+DELETE_STALE_OFFERS_SQL = '''
+    DELETE FROM backend_bestoffer AS bo
+    WHERE bo.product_id = ANY(%(products)s) AND NOT EXISTS (
+        SELECT 1 FROM backend_productinfo AS pi
+        WHERE pi.product_id = bo.product_id AND pi.quantity > 0
+    )
+'''
+
+
+def refresh_best_offers(product_ids, batch_size=1000):
+    """
+    Пересчитывает BestOffer для продуктов, у которых менялись цены или
+    остатки. Вызывается после коммита записи, чтобы пересчёт видел
+    предложения всех магазинов, в том числе импортированные параллельно.
+    """
+    product_ids = sorted(set(product_ids))
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), batch_size):
+            chunk = {'products': product_ids[start:start + batch_size]}
+            cursor.execute(REFRESH_BEST_OFFERS_SQL, chunk)
+            cursor.execute(DELETE_STALE_OFFERS_SQL, chunk)
+
+
+def refresh_catalog_on_commit(shop_ids, product_ids, batch_size=1000, stock_only=False):
+    """
+    После коммита пересчитывает лучшие предложения и только затем меняет
+    версию кэша каталога: в обратном порядке запрос между двумя шагами
+    закэшировал бы старые BestOffer под новой версией. Коллекции читаются
+    в момент коммита, их можно дополнять до него. stock_only — менялись
+    только остатки (заказы): версия меняется лишь у магазинов.
+    """
+    def refresh():
+        refresh_best_offers(product_ids, batch_size)
+        for shop_id in set(shop_ids):
+            bump_catalog_version(shop_id, shop_only=stock_only)
+    transaction.on_commit(refresh)
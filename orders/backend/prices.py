@@ -0,0 +1,56 @@
+from django.db import connection, transaction
+
+from .changes import record_changes
+from .offers import refresh_catalog_on_commit
+
+# Одним UPDATE по всем строкам запроса. Не переданное поле (NULL) не
+# меняется; строки, где ничего не изменилось, не трогаются и не получают
+# новую версию. Отпечаток сбрасывается, чтобы следующий импорт прайса
+# записал товар заново, а не счёл его неизменным.
+APPLY_PRICE_UPDATES_SQL = '''
+    UPDATE backend_productinfo AS pi
+    SET price = coalesce(u.price, pi.price),
+        price_rrc = coalesce(u.price_rrc, pi.price_rrc),
+        quantity = coalesce(u.quantity, pi.quantity),
+        fingerprint = '',
+        version = nextval('backend_productinfo_version_seq'),
+        updated_at = now()
+    FROM unnest(%s::bigint[], %s::numeric[], %s::numeric[], %s::integer[])
+        AS u(product_id, price, price_rrc, quantity)
+    WHERE pi.shop_id = %s AND pi.product_id = u.product_id
+      AND (pi.price, pi.price_rrc, pi.quantity) IS DISTINCT FROM
+          (coalesce(u.price, pi.price), coalesce(u.price_rrc, pi.price_rrc), coalesce(u.quantity, pi.quantity))
+    RETURNING pi.product_id, pi.id
+'''
+
+
+def apply_price_updates(shop, updates):
+    """
+    Применяет обновления цен и остатков магазина в одной транзакции.
+    updates — словари product_id/price/price_rrc/quantity (кроме product_id
+    всё необязательно). Возвращает статус по product_id: updated,
+    unchanged или not_found.
+    """
+    product_ids = [update['product_id'] for update in updates]
+    columns = [product_ids] + [
+        [update.get(field) for update in updates] for field in ('price', 'price_rrc', 'quantity')
+    ]
+    with transaction.atomic():
+        # Сначала блокировка строк по возрастанию id, как в
+        # reservations._adjust_stock: порядок блокировок самого UPDATE ... FROM
+        # не определён, и встречное оформление заказа могло бы взаимно
+        # заблокироваться с массовым обновлением.
+        list(shop.product_infos.select_for_update().filter(product_id__in=product_ids).order_by('pk').values_list(
+            'pk'))
+        with connection.cursor() as cursor:
+            cursor.execute(APPLY_PRICE_UPDATES_SQL, [*columns, shop.pk])
+            updated = dict(cursor.fetchall())
+        existing = set(shop.product_infos.filter(product_id__in=product_ids).values_list('product_id', flat=True))
+        if updated:
+            record_changes(updated.values())
+            refresh_catalog_on_commit([shop.pk], list(updated))
+
+    return {
+        product_id: 'updated' if product_id in updated else 'unchanged' if product_id in existing else 'not_found'
+        for product_id in product_ids
+    }
@@ -0,0 +1,130 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .changes import record_changes
+from .models import Order, OrderStatusHistory, ProductInfo, StockReservation
+from .offers import refresh_catalog_on_commit
+from .rollups import record_sales
+
+
+class OutOfStock(Exception):
+    """Не хватило остатка; shortages — [{'product_info', 'requested', 'available'}]."""
+
+    def __init__(self, shortages):
+        super().__init__('Недостаточно товара на складе')
+        self.shortages = shortages
+
+
+# Одним UPDATE по всем позициям. Строка меняется, только если остаток не
+# уходит в минус — это и есть условное списание; вернувшиеся строки
+# изменены, остальных не хватило.
+ADJUST_STOCK_SQL = '''
+    UPDATE backend_productinfo AS pi
+    SET quantity = pi.quantity + u.delta,
+        version = nextval('backend_productinfo_version_seq'),
+        updated_at = now()
+    FROM unnest(%s::bigint[], %s::integer[]) AS u(id, delta)
+    WHERE pi.id = u.id AND pi.quantity + u.delta >= 0
+    RETURNING pi.id, pi.shop_id, pi.product_id
+'''
+
+
+def stock_changed(rows):
+    """
+    Остаток строк изменился: лента изменений, кэш каталога и лучшие
+    предложения после коммита. rows — {product_info_id: (shop_id, product_id)}.
+    """
+    record_changes(rows.keys())
+    refresh_catalog_on_commit([shop_id for shop_id, _ in rows.values()],
+                              [product_id for _, product_id in rows.values()], stock_only=True)
+
+
+def _adjust_stock(deltas):
+    """
+    Меняет остатки на deltas ({product_info_id: приращение}) двумя запросами
+    при любом числе позиций. Возвращает изменённые строки, как stock_changed.
+    """
+    ids = sorted(deltas)
+    # Строки блокируются по возрастанию id: у встречных оформлений одинаковый
+    # порядок захвата, и взаимных блокировок не бывает. Порядок, в котором
+    # блокирует сам UPDATE, не определён — поэтому сначала SELECT FOR UPDATE.
+    list(ProductInfo.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk'))
+    with connection.cursor() as cursor:
+        cursor.execute(ADJUST_STOCK_SQL, [ids, [deltas[pk] for pk in ids]])
+        return {pk: (shop_id, product_id) for pk, shop_id, product_id in cursor.fetchall()}
+
+
+def reserve_stock(order, quantities):
+    """
+    Списывает остатки под заказ и записывает резервы. quantities —
+    {product_info_id: количество}. Вызывается внутри транзакции заказа;
+    при нехватке бросает OutOfStock со всеми недостающими позициями.
+    """
+    changed = _adjust_stock({pk: -quantity for pk, quantity in quantities.items()})
+    failed = sorted(set(quantities) - set(changed))
+    if failed:
+        available = dict(ProductInfo.objects.filter(pk__in=failed).values_list('id', 'quantity'))
+        raise OutOfStock([
+            {'product_info': pk, 'requested': quantities[pk], 'available': available.get(pk, 0)}
+            for pk in failed
+        ])
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_info_id=pk, quantity=quantity, expires_at=expires_at)
+        for pk, quantity in quantities.items()
+    ])
+    stock_changed(changed)
+
+
+def release_reservations(orders):
+    """Возвращает на склад остатки, зарезервированные под заказы (отмена)."""
+    reservations = StockReservation.objects.filter(order__in=orders)
+    quantities = dict(reservations.values('product_info').annotate(total=Sum('quantity')).values_list(
+        'product_info', 'total'))
+    if quantities:
+        changed = _adjust_stock(quantities)
+        reservations.delete()
+        stock_changed(changed)
+
+
+def commit_reservations(orders):
+    """
+    Заказ подтверждён: резервы больше не истекают, но остаются до отгрузки,
+    чтобы отмена заказа в обработке вернула остаток на склад.
+    """
+    StockReservation.objects.filter(order__in=orders).update(expires_at=None)
+
+
+def close_reservations(orders):
+    """Заказ отгружен: товар ушёл со склада, возвращать больше нечего."""
+    StockReservation.objects.filter(order__in=orders).delete()
+
+
+def release_expired_reservations(now=None, batch_size=100):
+    """
+    Отменяет новые заказы с истёкшим резервом и возвращает остатки.
+    Заказы, которые сейчас меняет кто-то другой, пропускаются (SKIP LOCKED)
+    и будут обработаны следующим запуском. Возвращает число отменённых заказов.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            orders = list(Order.objects.select_for_update(skip_locked=True).filter(
+                status='new', pk__in=StockReservation.objects.filter(expires_at__lt=now).values('order'),
+            ).order_by('pk')[:batch_size])
+            if not orders:
+                return released
+            release_reservations(orders)
+            record_sales([order.pk for order in orders], -1)
+            for order in orders:
+                order.status = 'canceled'
+                order.save(update_fields=['status'])
+            OrderStatusHistory.objects.bulk_create([
+                OrderStatusHistory(order=order, status='canceled', note='Резерв истёк') for order in orders
+            ])
+        released += len(orders)
@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import ArchivedOrder, Order, ProductDailySales, ShopDailySales
+
+# Приращения продаж по строкам заказов, отобранным {where}, — одним
+# запросом в обе таблицы. День — дата оформления в TIME_ZONE проекта,
+# sign = -1 вычитает (отмена). Строки вставляются в порядке ключа, так что
+# параллельные обновления блокируют их в одном порядке и не сталкиваются.
+APPLY_SALES_SQL = '''
+    WITH lines AS (
+        SELECT (o.created_at AT TIME ZONE %(tz)s)::date AS day, o.id AS order_id,
+               pi.shop_id, pi.product_id,
+               %(sign)s * i.quantity AS units, %(sign)s * i.quantity * i.price AS revenue
+        FROM {orders} AS o
+        JOIN {items} AS i ON i.order_id = o.id
+        JOIN backend_productinfo AS pi ON pi.id = i.product_info_id
+        WHERE {where}
+    ), shops AS (
+        INSERT INTO backend_shopdailysales AS s (day, shop_id, revenue, units, orders)
+        SELECT day, shop_id, sum(revenue), sum(units), %(sign)s * count(DISTINCT order_id)
+        FROM lines
+        GROUP BY day, shop_id
+        ORDER BY shop_id, day
+        ON CONFLICT (shop_id, day) DO UPDATE
+        SET revenue = s.revenue + excluded.revenue,
+            units = s.units + excluded.units,
+            orders = s.orders + excluded.orders
+    )
+    INSERT INTO backend_productdailysales AS p (day, shop_id, product_id, revenue, units, orders)
+    SELECT day, shop_id, product_id, sum(revenue), sum(units), %(sign)s * count(DISTINCT order_id)
+    FROM lines
+    GROUP BY day, shop_id, product_id
+    ORDER BY shop_id, product_id, day
+    ON CONFLICT (shop_id, product_id, day) DO UPDATE
+    SET revenue = p.revenue + excluded.revenue,
+        units = p.units + excluded.units,
+        orders = p.orders + excluded.orders
+'''
+
+LIVE_TABLES = {'orders': 'backend_order', 'items': 'backend_orderitem'}
+ARCHIVE_TABLES = {'orders': 'backend_archivedorder', 'items': 'backend_archivedorderitem'}
+
+
+def _apply(tables, where, params):
+    sql = APPLY_SALES_SQL.format(where=where, **tables)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'tz': settings.TIME_ZONE, **params})
+
+
+def apply_sales(order_ids, sign=1):
+    """Добавляет (sign=1) или вычитает (sign=-1) заказы в сводках продаж."""
+    order_ids = list(order_ids)
+    if order_ids:
+        _apply(LIVE_TABLES, 'o.id = ANY(%(ids)s)', {'sign': sign, 'ids': order_ids})
+
+
+def record_sales(order_ids, sign=1):
+    """
+    apply_sales после коммита: сводки — производные данные, и строки за
+    день магазина не должны оставаться заблокированными до конца транзакции
+    оформления. Потерянное при сбое приращение исправит rebuild_sales.
+    """
+    order_ids = list(order_ids)
+    transaction.on_commit(lambda: apply_sales(order_ids, sign))
+
+
+def _rebuild_chunk(tables, low, high):
+    try:
+        with transaction.atomic():
+            _apply(tables, "o.status <> 'canceled' AND o.id >= %(low)s AND o.id < %(high)s",
+                   {'sign': 1, 'low': low, 'high': high})
+    finally:
+        connection.close()
+
+
+def rebuild_sales(chunk_size=10000, workers=4, progress=None):
+    """
+    Пересчитывает сводки с нуля по живым и архивным заказам: таблицы
+    очищаются, затем диапазоны id заказов складываются параллельно в
+    workers потоков. Заказы, оформленные во время пересчёта, попадают в
+    сводки обычным порядком (record_sales); отмены во время пересчёта могут
+    разойтись со сводкой — запускать в спокойное время.
+    progress(готово диапазонов, всего) вызывается по мере работы.
+    """
+    with transaction.atomic():
+        ShopDailySales.objects.all().delete()
+        ProductDailySales.objects.all().delete()
+        ranges = []
+        for tables, model in ((LIVE_TABLES, Order), (ARCHIVE_TABLES, ArchivedOrder)):
+            last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+            # Верхняя граница — не дальше last_id: заказы, оформленные во время
+            # пересчёта, добавит их собственный record_sales, а не пересчёт.
+            ranges += [(tables, low, min(low + chunk_size, last_id + 1))
+                       for low in range(0, last_id + 1, chunk_size)]
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(_rebuild_chunk, *args) for args in ranges]:
+            future.result()
+            done += 1
+            if progress:
+                progress(done, len(ranges))
+    return len(ranges)
@@ -0,0 +1,41 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'russian'
+
+REFRESH_SEARCH_TEXT_SQL = '''
+    UPDATE backend_productinfo AS pi
+    SET search_text = concat_ws(' ', p.name, pi.name, (
+        SELECT string_agg(pp.value, ' ' ORDER BY pp.id)
+        FROM backend_productparameter AS pp
+        WHERE pp.product_info_id = pi.id
+    ))
+    FROM backend_product AS p
+    WHERE p.id = pi.product_id AND pi.id = ANY(%s)
+'''
+
+
+def refresh_search_text(info_ids):
+    """Пересобирает search_text (и вместе с ним search_vector) одним UPDATE."""
+    info_ids = list(info_ids)
+    if info_ids:
+        with connection.cursor() as cursor:
+            cursor.execute(REFRESH_SEARCH_TEXT_SQL, [info_ids])
+
+
+def search_product_infos(queryset, search):
+    """
+    Полнотекстовый поиск по search_vector плюс нечёткий по триграммам
+    search_text (опечатки, части слов). Оба условия обслуживаются
+    GIN-индексами, результат упорядочен по релевантности.
+    """
+    query = SearchQuery(search, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(
+        Q(search_vector=query) | Q(search_text__trigram_word_similar=search)
+    ).annotate(
+        # double precision, чтобы ранг без потерь переживал курсор пагинации
+        rank=Cast(SearchRank(F('search_vector'), query) + TrigramWordSimilarity(search, 'search_text'),
+                  FloatField()),
+    ).order_by('-rank', 'id')
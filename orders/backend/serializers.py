@@ -4,7 +4,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.utils.crypto import get_random_string
 from .models import (
-    Shop, Product, ProductInfo, Parameter, ProductParameter,
+    Shop, Product, ProductInfo, Parameter, ProductParameter, BestOffer,
     Cart, CartItem, Contact, Order, OrderItem
 )
 
@@ -59,12 +59,43 @@ class ProductSerializer(serializers.ModelSerializer):
 class ProductInfoSerializer(serializers.ModelSerializer):
     product = ProductSerializer()
     shop = ShopSerializer()
-    product_parameters = ProductParameterSerializer(many=True)
+    product_parameters = serializers.JSONField(source='params', read_only=True)
 
     class Meta:
         model = ProductInfo
         fields = ('id', 'product', 'shop', 'price', 'quantity', 'product_parameters')
 
+# Быстрый путь для списков: тот же JSON, что у ProductInfoSerializer, но из
+# values() — одна выборка на всю страницу, параметры берутся из ProductInfo.params.
+PRODUCT_INFO_VALUES = ('id', 'product__name', 'product__category__name', 'shop__name', 'price', 'quantity',
+                       'params')
+
+def serialize_product_info_rows(rows):
+    return [
+        {
+            'id': row['id'],
+            'product': {'name': row['product__name'], 'category': row['product__category__name']},
+            'shop': {'name': row['shop__name']},
+            'price': str(row['price']),
+            'quantity': row['quantity'],
+            'product_parameters': row['params'],
+        }
+        for row in rows
+    ]
+
+class BestOfferSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BestOffer
+        fields = ('product', 'product_name', 'product_info', 'shop', 'shop_name', 'price',
+                  'total_quantity', 'offer_count')
+
+class PriceUpdateSerializer(serializers.Serializer):
+    """Одна строка массового обновления цен и остатков магазина."""
+    product_id = serializers.IntegerField(min_value=1)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    price_rrc = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    quantity = serializers.IntegerField(min_value=0, max_value=2147483647, required=False)
+
 # --- Cart ---
 class CartItemSerializer(serializers.ModelSerializer):
     product_info = ProductInfoSerializer(read_only=True)
@@ -103,13 +134,16 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ('id', 'product_info', 'quantity', 'price')
 
 class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True, read_only=True)
-    contact = ContactSerializer(read_only=True)
+    # Позиции и контакт — из снимка заказа, без запросов к каталогу.
+    items = serializers.JSONField(source='snapshot.items', read_only=True)
+    contact = serializers.JSONField(source='snapshot.contact', read_only=True)
     status_history = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
         fields = ('id', 'number', 'created_at', 'total', 'status', 'contact', 'items', 'status_history')
+        # Статус меняется только через Order.TRANSITIONS (backend.transitions).
+        read_only_fields = fields
 
     def get_status_history(self, obj):
         return [
@@ -117,10 +151,36 @@ class OrderSerializer(serializers.ModelSerializer):
             for s in obj.status_history.all()
         ]
 
+def order_snapshot(contact, items):
+    """
+    Снимок заказа: контакт и позиции (OrderItem с id) в формате
+    ContactSerializer/OrderItemSerializer. Товары читаются одной выборкой.
+    """
+    rows = ProductInfo.objects.filter(pk__in={item.product_info_id for item in items}).values(*PRODUCT_INFO_VALUES)
+    product_infos = {row['id']: row for row in serialize_product_info_rows(rows)}
+    return {
+        'contact': ContactSerializer(contact).data if contact else None,
+        'items': [
+            {
+                'id': item.pk,
+                'product_info': product_infos[item.product_info_id],
+                'quantity': item.quantity,
+                'price': str(item.price),
+            }
+            for item in items
+        ],
+    }
+
 class CreateOrderSerializer(serializers.Serializer):
     cart_id = serializers.IntegerField()
     contact_id = serializers.IntegerField()
 
+class BulkStatusSerializer(serializers.Serializer):
+    """Массовая смена статуса заказов персоналом."""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    note = serializers.CharField(required=False, allow_blank=True, default='')
+
 User = get_user_model()
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -1,3 +1,1248 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+import yaml
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now as timezone_now
+from rest_framework.authtoken.models import Token
+
+from core.price_list import PriceListReader
+
+from .autocomplete import SCAN_LIMIT, Autocomplete, PrefixIndex, normalize, tokenize
+from .cache import CATALOG_CACHE, autocomplete_version, bump_autocomplete_version, bump_catalog_version
+from .models import (
+    Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Contact, Order, OrderItem, User, BestOffer,
+    ProductInfoChange, ParameterFacet, Cart, CartItem, StockReservation, OrderStatusHistory,
+    ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusHistory, ShopDailySales, ProductDailySales,
+    next_product_info_version, product_info_params,
+)
+from .changes import record_changes
+from .facets import remove_from_facets
+from .numbers import HiLoSequence, ORDER_NUMBER_BLOCK, ORDER_NUMBER_SEQUENCE, next_order_number, order_numbers
+from .prices import apply_price_updates
+from .reservations import release_expired_reservations
+from .search import search_product_infos
+from .serializers import OrderSerializer, ProductInfoSerializer
+
+FEED_PATH = Path(__file__).resolve().parent.parent / 'shop1.yaml'
+
+
+def write_feed(testcase, text):
+    """Прайс во временном файле; файл удаляется после теста."""
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as feed:
+        feed.write(text)
+    testcase.addCleanup(os.unlink, feed.name)
+    return feed.name
+
+
+def import_feed(testcase, text, **options):
+    """Импортирует прайс командой, выполняя on_commit-колбэки; возвращает её вывод."""
+    out = StringIO()
+    with testcase.captureOnCommitCallbacks(execute=True):
+        call_command('import_products_from_yaml', write_feed(testcase, text), stdout=out, **options)
+    return out.getvalue()
+
+
+def create_user(username, **fields):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='secret', **fields)
+
+
+def create_buyer(username='buyer', **contact_fields):
+    """Покупатель с контактом для оформления заказа."""
+    user = create_user(username)
+    contact = Contact.objects.create(user=user, last_name='Иванов', first_name='Иван', email=user.email,
+                                     phone='+70000000000', **contact_fields)
+    return user, contact
+
+
+def create_offer(shop=None, category=None, name='Смартфон', model='model', quantity=10, price=100, price_rrc=200,
+                 **fields):
+    """Предложение магазина с новым продуктом; магазин и категория создаются, если не переданы."""
+    product = Product.objects.create(name=name, category=category or Category.objects.create(name='Смартфоны'))
+    return ProductInfo.objects.create(product=product, shop=shop or Shop.objects.create(name='Магазин'), name=model,
+                                      quantity=quantity, price=price, price_rrc=price_rrc, **fields)
+
+
+class CheckoutMixin:
+    """Оформление заказа через API от имени self.user с контактом self.contact."""
+
+    def auth(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        return {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+    def fill_cart(self, *lines):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_info=info, quantity=quantity, price=info.price) for info, quantity in lines
+        ])
+        return cart
+
+    def submit_cart(self, cart, auth):
+        return self.client.post('/orders/create_from_cart/', {'cart_id': cart.pk, 'contact_id': self.contact.pk},
+                                content_type='application/json', **auth)
+
+    def checkout(self, *lines):
+        cart, auth = self.fill_cart(*lines), self.auth(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.submit_cart(cart, auth)
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = FEED_PATH.read_bytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-yaml')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchShopFeedsTests(TransactionTestCase):
+    def setUp(self):
+        FeedHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.shop = Shop.objects.create(
+            name='Связной', url=f'http://127.0.0.1:{self.server.server_port}/shop1.yaml'
+        )
+
+    def test_imports_feed_and_skips_it_when_not_modified(self):
+        out = StringIO()
+        call_command('fetch_shop_feeds', stdout=out)
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 14)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.feed_etag, '"v1"')
+
+        call_command('fetch_shop_feeds', stdout=out)
+        self.assertEqual(FeedHandler.requests[-1].get('If-None-Match'), '"v1"')
+        self.assertIn('прайс не изменился', out.getvalue())
+
+
+class ParallelImportTests(TransactionTestCase):
+    def test_parallel_import_does_not_duplicate_shared_rows(self):
+        feed = FEED_PATH.read_text(encoding='utf-8')
+        paths = [write_feed(self, feed.replace('shop: Связной', f'shop: {shop}')) for shop in ('Связной', 'Евросеть')]
+
+        out = StringIO()
+        call_command('import_products_from_yaml', *paths, workers=2, stdout=out)
+        self.assertNotIn('Ошибка', out.getvalue())
+        self.assertEqual(Shop.objects.count(), 2)
+        for shop in Shop.objects.all():
+            self.assertEqual(shop.product_infos.count(), 14)
+        self.assertEqual(Product.objects.count(), 14)
+        self.assertFalse(Parameter.objects.values('name').annotate(n=Count('id')).filter(n__gt=1).exists())
+        self.assertFalse(Product.objects.values('name').annotate(n=Count('id')).filter(n__gt=1).exists())
+
+
+class BulkImportTests(TestCase):
+    def import_feed(self, data, **options):
+        return import_feed(self, yaml.safe_dump(data, allow_unicode=True), bulk=True, **options)
+
+    def load_feed(self):
+        with open(FEED_PATH, encoding='utf-8') as file:
+            return yaml.safe_load(file)
+
+    def snapshot(self):
+        return list(ProductInfo.objects.order_by('id').values_list('id', 'price', 'quantity', 'version'))
+
+    def test_first_import_reports_counters(self):
+        out = self.import_feed(self.load_feed())
+        self.assertIn('новых 14, изменённых 0, без изменений 0, пропавших из прайса 0', out)
+        self.assertIn('ProductInfo: вставлено 14, обновлено 0, без изменений 0, удалено 0', out)
+        self.assertIn('Shop: вставлено 1', out)
+
+    def test_unchanged_goods_are_skipped_by_fingerprint(self):
+        data = self.load_feed()
+        self.import_feed(data)
+        before = self.snapshot()
+        data['goods'][0]['price'] += 1
+
+        out = self.import_feed(data)
+        self.assertIn('новых 0, изменённых 1, без изменений 13, пропавших из прайса 0', out)
+        self.assertIn('ProductInfo: вставлено 0, обновлено 1, без изменений 13', out)
+        after = self.snapshot()
+        changed = [row for old, row in zip(before, after) if old != row]
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(changed[0][1], data['goods'][0]['price'])
+
+    def test_goods_missing_from_feed_are_zeroed(self):
+        data = self.load_feed()
+        self.import_feed(data)
+        gone = data['goods'].pop()
+
+        out = self.import_feed(data)
+        self.assertIn('новых 0, изменённых 0, без изменений 13, пропавших из прайса 1', out)
+        self.assertEqual(ProductInfo.objects.get(product_id=gone['id']).quantity, 0)
+        self.assertFalse(ProductInfo.objects.exclude(product_id=gone['id']).filter(quantity=0).exists())
+
+    def test_keep_missing_leaves_missing_goods_alone(self):
+        data = self.load_feed()
+        self.import_feed(data)
+        gone = data['goods'].pop()
+
+        out = self.import_feed(data, keep_missing=True)
+        self.assertIn('пропавших из прайса 0', out)
+        self.assertEqual(ProductInfo.objects.get(product_id=gone['id']).quantity, gone['quantity'])
+
+    def test_dry_run_writes_nothing(self):
+        data = self.load_feed()
+        out = self.import_feed(data, dry_run=True)
+        self.assertIn('новых 14', out)
+        self.assertFalse(Shop.objects.exists())
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Parameter.objects.exists())
+
+        self.import_feed(data)
+        before = self.snapshot()
+        changes = ProductInfoChange.objects.count()
+        data['goods'][0]['price'] += 1
+        gone = data['goods'].pop()
+        out = self.import_feed(data, dry_run=True)
+        self.assertIn('новых 0, изменённых 1, без изменений 12, пропавших из прайса 1', out)
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(ProductInfoChange.objects.count(), changes)
+        self.assertNotEqual(ProductInfo.objects.get(product_id=gone['id']).quantity, 0)
+
+    def catalog_rows(self):
+        return {
+            'shops': list(Shop.objects.values_list('name', 'categories__id').order_by('name', 'categories__id')),
+            'categories': list(Category.objects.values_list('id', 'name').order_by('id')),
+            'products': list(Product.objects.values_list('id', 'name', 'category_id').order_by('id')),
+            'parameters': sorted(Parameter.objects.values_list('name', flat=True)),
+            'product_infos': list(ProductInfo.objects.values_list(
+                'product_id', 'name', 'price', 'price_rrc', 'quantity', 'params').order_by('product_id')),
+            'product_parameters': list(ProductParameter.objects.values_list(
+                'product_info__product_id', 'parameter__name', 'value').order_by(
+                'product_info__product_id', 'parameter__name')),
+        }
+
+    def test_bulk_and_stream_import_match_row_by_row(self):
+        call_command('import_products_from_yaml', str(FEED_PATH), stdout=StringIO())
+        expected = self.catalog_rows()
+        for options in ({'bulk': True}, {'stream': True}):
+            with self.subTest(**options):
+                Shop.objects.all().delete()
+                Product.objects.all().delete()
+                Category.objects.all().delete()
+                Parameter.objects.all().delete()
+                call_command('import_products_from_yaml', str(FEED_PATH), stdout=StringIO(), **options)
+                self.assertEqual(self.catalog_rows(), expected)
+
+    def test_stream_reader_requires_header_before_goods(self):
+        reader = PriceListReader(StringIO('goods: []\nshop: Связной\ncategories: []\n'))
+        with self.assertRaisesMessage(ValueError, 'должны идти перед goods'):
+            reader.read_header()
+
+        feed = FEED_PATH.read_text(encoding='utf-8')
+        goods_first = feed[feed.index('goods:'):] + feed[:feed.index('goods:')]
+        self.assertIn('должны идти перед goods', import_feed(self, goods_first, stream=True))
+        self.assertFalse(Shop.objects.exists())
+
+    def test_stream_reader_rejects_aliases(self):
+        reader = PriceListReader(StringIO(
+            'shop: Связной\ncategories:\n  - &phones {id: 1, name: Смартфоны}\n  - *phones\ngoods: []\n'
+        ))
+        with self.assertRaisesMessage(ValueError, 'alias'):
+            reader.read_header()
+
+
+class ProductInfoListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = Shop.objects.create(name='Магазин')
+        category = Category.objects.create(name='Смартфоны')
+        color = Parameter.objects.create(name='Цвет')
+        memory = Parameter.objects.create(name='Память')
+        for i in range(60):
+            parameters = {'Цвет': 'черный', 'Память': 64 * i}
+            info = create_offer(shop, category, name=f'Смартфон {i}', model=f'model/{i}', quantity=i, price=100 + i,
+                                params=product_info_params(parameters))
+            ProductParameter.objects.create(product_info=info, parameter=color, value='черный')
+            ProductParameter.objects.create(product_info=info, parameter=memory, value=str(64 * i))
+
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for page_size in (1, 10, 50):
+            with self.assertNumQueries(1):
+                response = self.client.get('/products/', {'page_size': page_size})
+            self.assertEqual(len(response.json()['results']), page_size)
+
+    def test_matches_model_serializer_output(self):
+        results = self.client.get('/products/', {'page_size': 5}).json()['results']
+        expected = ProductInfoSerializer(ProductInfo.objects.order_by('id')[:5], many=True).data
+        self.assertEqual(results, json.loads(json.dumps(expected)))
+        self.assertEqual(results[1]['product_parameters'], [
+            {'parameter': {'name': 'Цвет'}, 'value': 'черный'},
+            {'parameter': {'name': 'Память'}, 'value': '64'},
+        ])
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('import_products_from_yaml', str(FEED_PATH), bulk=True, stdout=StringIO())
+
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+
+    def read_pages(self, **params):
+        ids = []
+        response = self.client.get('/products/', params)
+        while True:
+            page = response.json()
+            ids += [row['id'] for row in page['results']]
+            if not page['next']:
+                return ids
+            response = self.client.get(page['next'])
+
+    def test_trigram_search_tolerates_typo_in_parameter_value(self):
+        results = self.client.get('/products/', {'search': 'золотистй'}).json()['results']
+        expected = ProductParameter.objects.filter(value='золотистый').values_list('product_info_id', flat=True)
+        self.assertTrue(expected)
+        self.assertLessEqual(set(expected), {row['id'] for row in results})
+
+    def test_cursor_walks_all_rows_in_default_order(self):
+        ids = self.read_pages(page_size=3)
+        self.assertEqual(ids, list(ProductInfo.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_cursor_walks_search_results_with_tied_ranks(self):
+        ranked = list(search_product_infos(ProductInfo.objects.all(), 'смартфон').values_list('id', 'rank'))
+        ranks = [rank for _, rank in ranked]
+        self.assertGreater(len(ranked), 3)
+        self.assertLess(len(set(ranks)), len(ranks))
+
+        ids = self.read_pages(search='смартфон', page_size=2)
+        self.assertEqual(ids, [pk for pk, _ in ranked])
+
+    def test_malformed_cursor_is_not_found(self):
+        for cursor in ('не-base64', 'bm90IGpzb24=', 'WzEsMl0=', 'WyJ4Il0='):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/products/', {'cursor': cursor}).status_code, 404)
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.info = create_offer(quantity=1)
+        cls.shop = cls.info.shop
+
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get('/products/', {'page_size': 10, 'shop': self.shop.pk})
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get('/products/', {'shop': self.shop.pk, 'page_size': 10})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+
+    def test_import_commit_invalidates_cached_responses(self):
+        feed = FEED_PATH.read_text(encoding='utf-8')
+        for options in ({'bulk': True}, {}):
+            with self.subTest(**options):
+                import_feed(self, feed, bulk=True)
+                info = ProductInfo.objects.get(shop__name='Связной', product_id=4216292)
+                params = {'shop': info.shop_id, 'page_size': 100}
+                for _ in range(2):
+                    detail = self.client.get(f'/products/{info.pk}/')
+                    listing = self.client.get('/products/', params)
+                self.assertEqual((detail['X-Cache'], listing['X-Cache']), ('HIT', 'HIT'))
+
+                import_feed(self, feed.replace('quantity: 14', 'quantity: 3'), **options)
+                detail = self.client.get(f'/products/{info.pk}/')
+                listing = self.client.get('/products/', params)
+                self.assertEqual((detail['X-Cache'], listing['X-Cache']), ('MISS', 'MISS'))
+                self.assertEqual(detail.json()['quantity'], 3)
+                self.assertEqual([row['quantity'] for row in listing.json()['results'] if row['id'] == info.pk], [3])
+
+
+class ETagTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.info = create_offer(quantity=1)
+        cls.shop = cls.info.shop
+        cls.user, contact = create_buyer()
+        cls.order = Order.objects.create(user=cls.user, contact=contact, total=100)
+        OrderItem.objects.create(order=cls.order, product_info=cls.info, quantity=1, price=100)
+
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+
+    def test_detail_not_modified_until_row_version_changes(self):
+        url = f'/products/{self.info.pk}/'
+        etag = self.client.get(url)['ETag']
+        caches[CATALOG_CACHE].clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        ProductInfo.objects.filter(pk=self.info.pk).update(price=90, version=next_product_info_version())
+        bump_catalog_version(self.shop.pk)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_served_as_not_modified_from_cache(self):
+        etag = self.client.get('/products/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_order_etag_follows_order_version_only(self):
+        token = Token.objects.create(user=self.user)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+        url = f'/orders/{self.order.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.order.status = 'processing'
+        self.order.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+
+        # Позиции заказа — снимок на момент оформления: каталог на ответ не влияет.
+        ProductInfo.objects.filter(pk=self.info.pk).update(quantity=0, version=next_product_info_version())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=changed['ETag']).status_code, 304)
+
+
+class ParameterFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('import_products_from_yaml', str(FEED_PATH), bulk=True, stdout=StringIO())
+
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+
+    def test_import_maintains_facet_counts(self):
+        expected = {
+            (row['parameter__name'], row['value']): row['total']
+            for row in ProductParameter.objects.values('parameter__name', 'value').annotate(total=Count('id'))
+        }
+        with self.assertNumQueries(1):
+            facets = self.client.get('/products/facets/').json()
+        counts = {(facet['name'], value['value']): value['count'] for facet in facets for value in facet['values']}
+        self.assertEqual(counts, expected)
+
+    def test_filters_by_parameters(self):
+        response = self.client.get('/products/', {
+            'param[Цвет]': ['черный', 'красный'], 'param[Встроенная память (Гб)]': '256',
+        })
+        ids = [row['id'] for row in response.json()['results']]
+        expected = ProductInfo.objects.filter(
+            product_parameters__parameter__name='Цвет', product_parameters__value__in=['черный', 'красный'],
+        ).filter(
+            product_parameters__parameter__name='Встроенная память (Гб)', product_parameters__value='256',
+        ).order_by('id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+        self.assertEqual(len(ids), 2)
+
+    def test_params_column_mirrors_parameter_rows(self):
+        for info in ProductInfo.objects.prefetch_related('product_parameters__parameter'):
+            rows = {(pp.parameter.name, pp.value) for pp in info.product_parameters.all()}
+            self.assertEqual({(item['parameter']['name'], item['value']) for item in info.params}, rows)
+
+    def test_filtered_facets_count_result_rows(self):
+        facets = self.client.get('/products/facets/', {'param[Цвет]': 'черный'}).json()
+        colors = next(facet['values'] for facet in facets if facet['name'] == 'Цвет')
+        total = ProductInfo.objects.filter(product_parameters__value='черный',
+                                           product_parameters__parameter__name='Цвет').count()
+        self.assertEqual(colors, [{'value': 'черный', 'count': total}])
+
+    def test_removal_deletes_only_emptied_values_it_touched(self):
+        other = Shop.objects.create(name='Другой')
+        stray = ParameterFacet.objects.create(shop=other, parameter=Parameter.objects.first(), value='x', count=0)
+        remove_from_facets(ProductInfo.objects.values_list('id', flat=True))
+        self.assertEqual(list(ParameterFacet.objects.all()), [stray])
+
+
+class BestOfferTests(TestCase):
+    def import_feed(self, text):
+        import_feed(self, text, bulk=True)
+
+    def test_import_keeps_best_offers_current(self):
+        feed = FEED_PATH.read_text(encoding='utf-8')
+        self.import_feed(feed)
+        cheaper = feed.replace('shop: Связной', 'shop: Евросеть').replace('price: 110000', 'price: 90000')
+        self.import_feed(cheaper)
+
+        offer = BestOffer.objects.get(price=90000)
+        self.assertEqual(offer.shop_name, 'Евросеть')
+        self.assertEqual(offer.offer_count, 2)
+        with self.assertNumQueries(1):
+            results = self.client.get('/products/best-offers/', {'page_size': 100}).json()['results']
+        self.assertEqual(len(results), BestOffer.objects.count())
+
+        # Товар кончился во втором магазине — лучшим снова становится первый.
+        self.import_feed(cheaper.replace('price: 90000\n    price_rrc: 116990\n    quantity: 14',
+                                         'price: 90000\n    price_rrc: 116990\n    quantity: 0'))
+        offer.refresh_from_db()
+        self.assertEqual(offer.shop_name, 'Связной')
+        self.assertEqual(offer.offer_count, 1)
+
+    def test_cache_version_bumped_after_best_offers_refreshed(self):
+        self.import_feed(FEED_PATH.read_text(encoding='utf-8'))
+        offer = BestOffer.objects.order_by('pk').first()
+        seen = []
+
+        def bump(shop_id=None, shop_only=False):
+            # Новая версия кэша должна появиться, когда BestOffer уже пересчитаны.
+            seen.append(BestOffer.objects.get(pk=offer.pk).price)
+            bump_catalog_version(shop_id, shop_only)
+
+        with patch('backend.offers.bump_catalog_version', side_effect=bump), \
+                self.captureOnCommitCallbacks(execute=True):
+            apply_price_updates(Shop.objects.get(), [{'product_id': offer.pk, 'price': Decimal('1.00')}])
+        self.assertEqual(seen, [Decimal('1.00')])
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Смартфоны')
+        cls.shop = Shop.objects.create(name='Магазин')
+        for name in ('Смартфон Apple iPhone XR', 'Смартфон Apple iPhone XS', 'Смартфон Samsung Galaxy'):
+            create_offer(cls.shop, cls.category, name=name, quantity=1)
+
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+        self.autocomplete = Autocomplete()
+
+    def test_prefix_search_is_served_from_memory(self):
+        self.autocomplete.search('смарт')
+        with self.assertNumQueries(0):
+            results = self.autocomplete.search('смарт iph', limit=5)
+        self.assertEqual([entry['name'] for entry in results],
+                         ['Смартфон Apple iPhone XR', 'Смартфон Apple iPhone XS'])
+        self.assertEqual(self.autocomplete.search('смарт', limit=1)[0]['type'], 'category')
+
+    def refresh(self):
+        bump_autocomplete_version()
+        self.autocomplete.refresh(autocomplete_version())
+
+    def test_new_products_are_patched_in_on_version_change(self):
+        self.autocomplete.search('xiaomi')
+        index = self.autocomplete.index
+        Product.objects.create(name='Смартфон Xiaomi Redmi', category=self.category)
+        self.refresh()
+        self.assertEqual([entry['name'] for entry in self.autocomplete.search('xiaomi')], ['Смартфон Xiaomi Redmi'])
+        # Индекс дополнен, а не построен заново: нетронутые списки общие.
+        self.assertIs(self.autocomplete.index.short_tokens['app'], index.short_tokens['app'])
+
+    def test_changed_product_weights_are_patched_in(self):
+        self.autocomplete.search('смартфон')
+        index = self.autocomplete.index
+        infos = ProductInfo.objects.filter(product__name='Смартфон Apple iPhone XR')
+        with self.captureOnCommitCallbacks(execute=True):
+            infos.update(quantity=0)
+            record_changes(infos.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.refresh()
+        # Категории без новых продуктов не перечитываются, индекс не перестраивается.
+        self.assertFalse([query for query in queries if 'FROM "backend_category"' in query['sql']])
+        self.assertIs(self.autocomplete.index.short_tokens['gal'], index.short_tokens['gal'])
+        names = [entry['name'] for entry in self.autocomplete.search('смартфон')]
+        self.assertEqual(names[-1], 'Смартфон Apple iPhone XR')
+
+    def test_deleted_products_rebuild_the_index(self):
+        self.autocomplete.search('samsung')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(name='Смартфон Samsung Galaxy').delete()
+        self.refresh()
+        self.assertEqual(self.autocomplete.search('samsung'), [])
+
+    def test_patched_index_matches_rebuilt(self):
+        vocabulary = ['смартфон', 'смарт-часы', 'смесь', 'сумка', 'apple', 'samsung', 'стекло']
+        entries = {
+            i: {'type': 'product', 'id': i, 'name': f'{vocabulary[i % 7]} {vocabulary[i * 3 % 7]} {i}',
+                'category': vocabulary[i * 5 % 7], 'weight': i % 11}
+            for i in range(1, 400)
+        }
+        index = PrefixIndex(entries.values())
+        changes = [{**entries[i], 'weight': i % 5} for i in range(1, 400, 7)]
+        changes += [{'type': 'product', 'id': i, 'name': f'сумка apple {i}', 'category': 'сумки', 'weight': i % 13}
+                    for i in range(400, 420)]
+        entries.update((entry['id'], entry) for entry in changes)
+        patched, rebuilt = index.patched(changes), PrefixIndex(entries.values())
+        for query in ('с', 'см', 'sa', 'смартф', 'сум app', 'с сум', 'стекло 1', 'сумки'):
+            with self.subTest(query=query):
+                self.assertEqual(patched.search(query, limit=20), rebuilt.search(query, limit=20))
+
+    def test_most_selective_word_drives_the_scan(self):
+        entries = [{'type': 'product', 'id': i, 'name': f'Смартфон {i}', 'weight': 1} for i in range(1, 3 * SCAN_LIMIT)]
+        entries.append({'type': 'product', 'id': 0, 'name': 'Смартфон Xiaomi', 'weight': 0})
+        index = PrefixIndex(entries)
+        # Длинное слово подходит всем записям, кандидатов даёт короткое.
+        self.assertEqual([entry['id'] for entry in index.search('смар xi')], [0])
+        self.assertEqual(index.search('смар 1 xi'), [])
+
+    def test_short_prefix_search_matches_full_ordering(self):
+        vocabulary = ['смартфон', 'смарт-часы', 'смесь', 'сумка', 'apple', 'samsung', 'стекло']
+        entries = [
+            {'type': 'product', 'id': i, 'name': f'{vocabulary[i % 7]} {vocabulary[i * 3 % 7]} {i}',
+             'category': vocabulary[i * 5 % 7], 'weight': i % 11}
+            for i in range(1, 400)
+        ]
+        index = PrefixIndex(entries)
+        for query in ('с', 'см', 'sa', 'смартф', 'смарт sam', 'с сум', 'стекло 1'):
+            words = tokenize(query)
+            head = normalize(query).strip()
+            expected = sorted(
+                (position for position, entry in enumerate(index.entries)
+                 if all(any(token.startswith(word) for token in tokenize(f"{entry['name']} {entry['category']}"))
+                        for word in words)),
+                key=lambda position: (not normalize(index.entries[position]['name']).startswith(head), position),
+            )[:10]
+            with self.subTest(query=query):
+                self.assertEqual([entry['id'] for entry in index.search(query)],
+                                 [index.entries[position]['id'] for position in expected])
+
+
+class ProductInfoBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = Shop.objects.create(name='Магазин')
+        category = Category.objects.create(name='Смартфоны')
+        cls.infos = [
+            create_offer(shop, category, name=f'Смартфон {i}', model=f'model/{i}', quantity=i, price=100 + i,
+                         params=product_info_params({'Цвет': 'черный'}))
+            for i in range(20)
+        ]
+
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+
+    def test_returns_cards_keyed_by_id_and_reports_missing(self):
+        ids = [info.pk for info in self.infos] + [0]
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/batch/', {'ids': ','.join(map(str, ids))})
+        data = response.json()
+        self.assertEqual(data['missing'], [0])
+        self.assertEqual(len(data['results']), 20)
+        info = self.infos[3]
+        expected = json.loads(json.dumps(ProductInfoSerializer(info).data))
+        self.assertEqual(data['results'][str(info.pk)], expected)
+
+    def test_rejects_malformed_ids(self):
+        self.assertEqual(self.client.get('/products/batch/', {'ids': '1,abc'}).status_code, 400)
+
+
+class CatalogExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('import_products_from_yaml', str(FEED_PATH), bulk=True, stdout=StringIO())
+
+    def test_streams_ndjson_filtered_by_changed_since(self):
+        stale = ProductInfo.objects.order_by('id')[:4].values_list('id', flat=True)
+        ProductInfo.objects.filter(id__in=list(stale)).update(updated_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+        response = self.client.get('/products/export/', {'changed_since': '2021-01-01'})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), ProductInfo.objects.count() - 4)
+        self.assertEqual(rows[0]['parameters'], {
+            item['parameter']['name']: item['value'] for item in ProductInfo.objects.get(pk=rows[0]['id']).params
+        })
+
+    def test_command_writes_csv_for_one_shop(self):
+        out = StringIO()
+        call_command('export_catalog', format='csv', shop='Связной', stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(len(rows), ProductInfo.objects.filter(shop__name='Связной').count())
+        self.assertEqual(rows[0]['shop'], 'Связной')
+
+
+class ChangeFeedTests(TestCase):
+    def import_feed(self, text):
+        import_feed(self, text, bulk=True)
+
+    def read_feed(self, since=0):
+        changes = []
+        while True:
+            page = self.client.get('/products/changes/', {'since': since, 'page_size': 5}).json()
+            changes += page['results']
+            since = page['since']
+            if not page['has_more']:
+                return changes, since
+
+    def test_feed_reports_latest_state_and_deletions(self):
+        feed = FEED_PATH.read_text(encoding='utf-8')
+        self.import_feed(feed)
+        changes, since = self.read_feed()
+        self.assertEqual(len(changes), ProductInfo.objects.count())
+
+        self.import_feed(feed.replace('price: 110000', 'price: 100000'))
+        info = ProductInfo.objects.get(price=100000)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductInfo.objects.filter(pk=changes[-1]['id']).delete()
+        changes, _ = self.read_feed(since)
+        self.assertEqual([(change['id'], change.get('deleted', False)) for change in changes],
+                         [(info.pk, False), (changes[-1]['id'], True)])
+        self.assertEqual(changes[0]['price'], '100000.00')
+        # Лента компактная: у строки остаётся одна запись.
+        self.assertEqual(ProductInfoChange.objects.filter(product_info_id=info.pk).count(), 1)
+
+    def test_cascade_delete_records_tombstones_in_one_statement(self):
+        shop = Shop.objects.create(name='Магазин')
+        category = Category.objects.create(name='Смартфоны')
+        query_counts = []
+        for size in (5, 50):
+            ids = [create_offer(shop, category, name=f'Смартфон {size}/{n}').pk for n in range(size)]
+            with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+                Shop.objects.filter(pk=shop.pk).delete()
+            self.assertEqual(callbacks, [])
+            query_counts.append(len(queries))
+            shop = Shop.objects.create(name='Магазин')
+        self.assertEqual(query_counts[0], query_counts[1])
+        changes, _ = self.read_feed()
+        self.assertEqual([change['id'] for change in changes if change.get('deleted')][-50:], ids)
+
+
+class ShopPriceUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('import_products_from_yaml', str(FEED_PATH), bulk=True, stdout=StringIO())
+        cls.shop = Shop.objects.get()
+        cls.owner = create_user('shop')
+        cls.shop.user = cls.owner
+        cls.shop.save()
+        cls.stranger = create_user('other')
+
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+
+    def post(self, user, items):
+        token, _ = Token.objects.get_or_create(user=user)
+        return self.client.post(f'/shops/{self.shop.pk}/prices/', {'items': items}, content_type='application/json',
+                                HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_applies_updates_and_reports_each_row(self):
+        first, second = ProductInfo.objects.filter(shop=self.shop).order_by('id')[:2]
+        cached = self.client.get(f'/products/{first.pk}/').json()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post(self.owner, [
+                {'product_id': first.product_id, 'price': '1.00', 'quantity': 3},
+                {'product_id': second.product_id, 'quantity': second.quantity},
+                {'product_id': 1, 'quantity': 1},
+                {'product_id': first.product_id, 'quantity': 7},
+                {'product_id': second.product_id, 'quantity': -1},
+            ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['status'] for row in response.json()['results']],
+                         ['updated', 'unchanged', 'not_found', 'duplicate', 'invalid'])
+
+        first.refresh_from_db()
+        self.assertEqual((first.price, first.price_rrc, first.quantity), (Decimal('1.00'), Decimal(116990), 3))
+        self.assertEqual(first.fingerprint, '')
+        self.assertNotEqual(self.client.get(f'/products/{first.pk}/').json(), cached)
+        self.assertEqual(ProductInfoChange.objects.filter(product_info_id=first.pk).latest('seq').seq,
+                         ProductInfoChange.objects.latest('seq').seq)
+
+    def test_rows_locked_in_id_order_before_update(self):
+        product_ids = list(ProductInfo.objects.filter(shop=self.shop).values_list('product_id', flat=True)[:3])
+        with CaptureQueriesContext(connection) as queries:
+            apply_price_updates(self.shop, [{'product_id': pk, 'quantity': 1} for pk in reversed(product_ids)])
+        sql = [query['sql'] for query in queries.captured_queries]
+        lock = next(n for n, query in enumerate(sql) if query.endswith('ORDER BY 1 ASC FOR UPDATE'))
+        update = next(n for n, query in enumerate(sql) if query.lstrip().startswith('UPDATE backend_productinfo'))
+        self.assertLess(lock, update)
+
+    def test_only_shop_owner_or_staff_may_update(self):
+        info = ProductInfo.objects.filter(shop=self.shop).first()
+        response = self.post(self.stranger, [{'product_id': info.product_id, 'quantity': 0}])
+        self.assertEqual(response.status_code, 403)
+
+
+class StockReservationTests(CheckoutMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phone = create_offer(model='phone', quantity=5, price=100, price_rrc=120)
+        cls.shop = cls.phone.shop
+        cls.case = create_offer(cls.shop, cls.phone.product.category, name='Чехол', model='case', quantity=1,
+                                price=10, price_rrc=12)
+        cls.user, cls.contact = create_buyer()
+        cls.staff = create_user('staff', is_staff=True)
+
+    def test_checkout_reserves_stock(self):
+        response = self.checkout((self.phone, 2), (self.case, 1))
+        self.assertEqual(response.status_code, 201)
+        self.phone.refresh_from_db()
+        self.case.refresh_from_db()
+        self.assertEqual((self.phone.quantity, self.case.quantity), (3, 0))
+        self.assertEqual(StockReservation.objects.filter(order_id=response.json()['id']).count(), 2)
+
+    def test_checkout_invalidates_only_the_shop_and_the_bought_rows(self):
+        caches[CATALOG_CACHE].clear()
+        urls = [f'/products/{self.phone.pk}/', f'/products/{self.case.pk}/', '/products/',
+                f'/products/?shop={self.shop.pk}']
+        for url in urls * 2:
+            self.client.get(url)
+        autocomplete = autocomplete_version()
+
+        self.assertEqual(self.checkout((self.phone, 2)).status_code, 201)
+        responses = [self.client.get(url) for url in urls]
+        self.assertEqual([response['X-Cache'] for response in responses], ['MISS', 'HIT', 'HIT', 'MISS'])
+        self.assertEqual(responses[0].json()['quantity'], 3)
+        self.assertEqual(autocomplete_version(), autocomplete)
+
+    def test_shortage_reported_per_item_and_nothing_reserved(self):
+        response = self.checkout((self.phone, 2), (self.case, 3))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['shortages'],
+                         [{'product_info': self.case.pk, 'requested': 3, 'available': 1}])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.quantity, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(CartItem.objects.exists())
+
+    def test_cancel_returns_stock_and_processing_keeps_it(self):
+        canceled = self.checkout((self.phone, 2)).json()['id']
+        confirmed = self.checkout((self.phone, 1)).json()['id']
+        for pk, new_status in ((canceled, 'canceled'), (confirmed, 'processing')):
+            response = self.client.post(f'/orders/{pk}/change_status/', {'status': new_status},
+                                        content_type='application/json', **self.auth(self.staff))
+            self.assertEqual(response.status_code, 200)
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.quantity, 4)
+        self.assertEqual(list(StockReservation.objects.values_list('order_id', 'expires_at')), [(confirmed, None)])
+
+    def change_status(self, pk, new_status):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/orders/{pk}/change_status/', {'status': new_status},
+                                        content_type='application/json', **self.auth(self.staff))
+        self.assertEqual(response.status_code, 200)
+
+    def test_cancel_after_processing_returns_stock_and_sale(self):
+        order = self.checkout((self.phone, 2)).json()['id']
+        self.change_status(order, 'processing')
+        # Резерв заказа в обработке не истекает.
+        self.assertEqual(release_expired_reservations(now=timezone_now() + timedelta(days=1)), 0)
+        self.assertEqual(Order.objects.get(pk=order).status, 'processing')
+
+        self.change_status(order, 'canceled')
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.quantity, 5)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(list(ShopDailySales.objects.values_list('units', 'orders')), [(0, 0)])
+
+    def test_shipping_closes_reservation_and_keeps_stock_spent(self):
+        order = self.checkout((self.phone, 2)).json()['id']
+        self.change_status(order, 'processing')
+        self.change_status(order, 'shipped')
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.quantity, 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_buyer_cannot_delete_edit_or_confirm_order(self):
+        order = self.checkout((self.phone, 2)).json()['id']
+        auth = self.auth(self.user)
+        self.assertEqual(self.client.delete(f'/orders/{order}/', **auth).status_code, 405)
+        self.assertEqual(self.client.patch(f'/orders/{order}/', {'status': 'delivered'},
+                                           content_type='application/json', **auth).status_code, 405)
+        self.assertEqual(self.client.post(f'/orders/{order}/confirm/', **auth).status_code, 404)
+        self.assertEqual(Order.objects.get(pk=order).status, 'new')
+        self.assertEqual(StockReservation.objects.filter(order_id=order).count(), 1)
+
+    def test_expired_reservations_released(self):
+        expired = self.checkout((self.phone, 2)).json()['id']
+        fresh = self.checkout((self.phone, 1)).json()['id']
+        StockReservation.objects.filter(order_id=expired).update(expires_at=timezone_now() - timedelta(minutes=1))
+
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.quantity, 4)
+        self.assertEqual(Order.objects.get(pk=expired).status, 'canceled')
+        self.assertEqual(Order.objects.get(pk=expired).status_history.latest('id').note, 'Резерв истёк')
+        self.assertEqual(Order.objects.get(pk=fresh).status, 'new')
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    buyers = 8
+    stock = 5
+
+    def setUp(self):
+        self.info = create_offer(model='phone', quantity=self.stock, price=100, price_rrc=120)
+        self.checkouts = []
+        for n in range(self.buyers):
+            user, contact = create_buyer(f'buyer{n}')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product_info=self.info, quantity=1, price=100)
+            self.checkouts.append((Token.objects.create(user=user).key, cart.pk, contact.pk))
+
+    def test_parallel_checkouts_never_oversell(self):
+        barrier = threading.Barrier(self.buyers)
+        statuses = []
+
+        def checkout(token, cart_id, contact_id):
+            try:
+                client = Client()
+                barrier.wait()
+                response = client.post('/orders/create_from_cart/', {'cart_id': cart_id, 'contact_id': contact_id},
+                                       content_type='application/json', HTTP_AUTHORIZATION=f'Token {token}')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=args) for args in self.checkouts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] * self.stock + [409] * (self.buyers - self.stock))
+        self.info.refresh_from_db()
+        self.assertEqual(self.info.quantity, 0)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(StockReservation.objects.count(), self.stock)
+
+
+class CheckoutQueryCountTests(CheckoutMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = Shop.objects.create(name='Магазин')
+        category = Category.objects.create(name='Смартфоны')
+        cls.infos = [
+            create_offer(shop, category, name=f'Смартфон {n}', model=f'model-{n}', price=100 + n) for n in range(40)
+        ]
+        cls.user, cls.contact = create_buyer()
+
+    def setUp(self):
+        # Свежий блок номеров: nextval не попадёт в замер посреди теста.
+        order_numbers.reset()
+        next_order_number()
+
+    def checkout(self, lines):
+        cart, auth = self.fill_cart(*((info, 2) for info in self.infos[:lines])), self.auth(self.user)
+        with self.assertNumQueries(17):
+            response = self.submit_cart(cart, auth)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        small = self.checkout(1)
+        large = self.checkout(40)
+        self.assertEqual(len(large['items']), 40)
+        self.assertEqual(Decimal(large['total']), sum(2 * info.price for info in self.infos))
+        self.assertEqual(Decimal(small['total']), 2 * self.infos[0].price)
+        self.assertEqual(OrderItem.objects.filter(order_id=large['id']).count(), 40)
+
+
+class OrderSnapshotTests(CheckoutMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.info = create_offer(quantity=100, params=product_info_params({'Цвет': 'чёрный'}))
+        cls.user, cls.contact = create_buyer(city='Москва')
+
+    def setUp(self):
+        self.client.defaults.update(self.auth(self.user))
+
+    def checkout(self):
+        response = super().checkout((self.info, 2))
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_order_frozen_at_checkout(self):
+        created = self.checkout()
+        self.assertEqual(created['contact']['city'], 'Москва')
+        self.assertEqual(created['items'][0]['product_info']['product'],
+                         {'name': 'Смартфон', 'category': 'Смартфоны'})
+        self.assertEqual(created['items'][0]['product_info']['product_parameters'],
+                         [{'parameter': {'name': 'Цвет'}, 'value': 'чёрный'}])
+
+        ProductInfo.objects.filter(pk=self.info.pk).update(price=1, version=next_product_info_version())
+        Product.objects.filter(pk=self.info.product_id).update(name='Другой')
+        Contact.objects.filter(pk=self.contact.pk).update(city='Казань')
+        order = self.client.get(f'/orders/{created["id"]}/').json()
+        self.assertEqual(order['items'], created['items'])
+        self.assertEqual(order['contact'], created['contact'])
+        self.assertEqual([entry['status'] for entry in order['status_history']], ['new'])
+
+    def test_list_and_retrieve_cost_constant_queries(self):
+        orders = [self.checkout() for _ in range(5)]
+        # Токен с пользователем, страница заказов, история.
+        with self.assertNumQueries(3):
+            listed = self.client.get('/orders/').json()
+        self.assertEqual(len(listed['results']), 5)
+        with self.assertNumQueries(3):
+            self.client.get(f'/orders/{orders[0]["id"]}/')
+
+
+class BulkStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        cls.staff = create_user('staff', is_staff=True)
+
+    def post(self, user, data):
+        token, _ = Token.objects.get_or_create(user=user)
+        return self.client.post('/orders/bulk_status/', data, content_type='application/json',
+                                HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_transitions_validated_and_reported_per_order(self):
+        processing = Order.objects.create(user=self.user, status='processing')
+        delivered = Order.objects.create(user=self.user, status='delivered')
+        response = self.post(self.staff, {'ids': [processing.pk, delivered.pk, 999999, processing.pk],
+                                          'status': 'shipped', 'note': 'Смена 3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'updated': 1, 'results': [
+            {'id': processing.pk, 'result': 'updated'},
+            {'id': delivered.pk, 'result': 'conflict', 'status': 'delivered'},
+            {'id': 999999, 'result': 'not_found'},
+        ]})
+        processing.refresh_from_db()
+        self.assertEqual((processing.status, processing.version), ('shipped', 2))
+        self.assertEqual(list(processing.status_history.values_list('status', 'note')), [('shipped', 'Смена 3')])
+        self.assertFalse(delivered.status_history.exists())
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        Token.objects.create(user=self.staff)
+        for size in (2, 50):
+            ids = [order.pk for order in Order.objects.bulk_create([
+                Order(user=self.user, status='processing') for _ in range(size)
+            ])]
+            with self.assertNumQueries(8):
+                response = self.post(self.staff, {'ids': ids, 'status': 'shipped'})
+            self.assertEqual(response.json()['updated'], size)
+
+    def test_cancel_returns_reserved_stock(self):
+        info = create_offer(quantity=3)
+        order = Order.objects.create(user=self.user)
+        StockReservation.objects.create(order=order, product_info=info, quantity=2,
+                                        expires_at=timezone_now() + timedelta(minutes=5))
+        self.assertEqual(self.post(self.staff, {'ids': [order.pk], 'status': 'canceled'}).json()['updated'], 1)
+        info.refresh_from_db()
+        self.assertEqual(info.quantity, 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_serializer_does_not_write_status(self):
+        order = Order.objects.create(user=self.user)
+        serializer = OrderSerializer(order, data={'status': 'delivered'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        self.assertNotIn('status', serializer.validated_data)
+
+    def test_rejects_non_staff_unknown_status_and_invalid_single_transition(self):
+        order = Order.objects.create(user=self.user)
+        self.assertEqual(self.post(self.user, {'ids': [order.pk], 'status': 'shipped'}).status_code, 403)
+        self.assertEqual(self.post(self.staff, {'ids': [order.pk], 'status': 'lost'}).status_code, 400)
+
+        token, _ = Token.objects.get_or_create(user=self.staff)
+        response = self.client.post(f'/orders/{order.pk}/change_status/', {'status': 'delivered'},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 409)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'new')
+
+
+class OrderNumberTests(TransactionTestCase):
+    def test_blocks_of_different_processes_do_not_overlap(self):
+        first = HiLoSequence(ORDER_NUMBER_SEQUENCE, ORDER_NUMBER_BLOCK)
+        second = HiLoSequence(ORDER_NUMBER_SEQUENCE, ORDER_NUMBER_BLOCK)
+        numbers = [sequence.next() for _ in range(ORDER_NUMBER_BLOCK + 10) for sequence in (first, second)]
+        self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_threads_share_a_block_without_duplicates(self):
+        sequence = HiLoSequence(ORDER_NUMBER_SEQUENCE, ORDER_NUMBER_BLOCK)
+        numbers = []
+
+        def allocate():
+            try:
+                numbers.extend(sequence.next() for _ in range(150))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(numbers)), 600)
+
+    def test_forked_process_takes_its_own_block(self):
+        sequence = HiLoSequence(ORDER_NUMBER_SEQUENCE, ORDER_NUMBER_BLOCK)
+        parent = sequence.next()
+        sequence._pid = -1  # как после fork: pid процесса сменился
+        child = sequence.next()
+        self.assertGreaterEqual(abs(child - parent), ORDER_NUMBER_BLOCK)
+
+    def test_orders_numbered_on_create(self):
+        order_numbers.reset()
+        first, second = Order.objects.create(), Order.objects.create()
+        self.assertRegex(first.number, r'^\d{8}$')
+        self.assertEqual(int(second.number), int(first.number) + 1)
+
+
+class OrderArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.info = create_offer()
+        cls.user = create_user('buyer')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.token.key}'
+
+    def make_order(self, status, days_ago):
+        order = Order.objects.create(user=self.user, status=status, total=100, snapshot={
+            'contact': None, 'items': [{'id': 1, 'quantity': 1, 'price': '100.00'}],
+        })
+        Order.objects.filter(pk=order.pk).update(created_at=timezone_now() - timedelta(days=days_ago))
+        OrderItem.objects.create(order=order, product_info=self.info, quantity=1, price=100)
+        OrderStatusHistory.objects.create(order=order, status=status, note='готово')
+        return order
+
+    def test_moves_only_old_terminal_orders_in_chunks(self):
+        old = [self.make_order(status, 400) for status in ('delivered', 'canceled', 'delivered')]
+        active = self.make_order('shipped', 400)
+        recent = self.make_order('delivered', 10)
+
+        out = StringIO()
+        call_command('archive_orders', '--older-than-days=365', '--chunk-size=2', '--max-chunks=1', stdout=out)
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+        call_command('archive_orders', '--older-than-days=365', '--chunk-size=2', stdout=out)
+
+        self.assertEqual(set(ArchivedOrder.objects.values_list('id', flat=True)), {order.pk for order in old})
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {active.pk, recent.pk})
+        self.assertEqual(ArchivedOrderItem.objects.count(), 3)
+        self.assertEqual(ArchivedOrderStatusHistory.objects.count(), 3)
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[order.pk for order in old]).exists())
+        archived = ArchivedOrder.objects.get(pk=old[0].pk)
+        self.assertEqual((archived.number, archived.user_id, archived.status), (old[0].number, self.user.pk,
+                                                                                 'delivered'))
+
+    def test_archived_orders_read_transparently(self):
+        order = self.make_order('delivered', 400)
+        live = self.client.get(f'/orders/{order.pk}/')
+        call_command('archive_orders', stdout=StringIO())
+
+        archived = self.client.get(f'/orders/{order.pk}/')
+        self.assertEqual(archived.status_code, 200)
+        self.assertEqual(archived.json(), live.json())
+        self.assertEqual(archived['ETag'], live['ETag'])
+        self.assertEqual(self.client.get('/orders/').json()['results'], [])
+        self.assertEqual([row['id'] for row in self.client.get('/orders/?archived=1').json()['results']],
+                         [order.pk])
+
+        token = Token.objects.create(user=create_user('other'))
+        response = self.client.get(f'/orders/{order.pk}/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_non_numeric_pk_is_not_found(self):
+        self.assertEqual(self.client.get('/orders/abc/').status_code, 404)
+
+
+class SalesRollupTests(CheckoutMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Смартфоны')
+        cls.shops = [Shop.objects.create(name=f'Магазин {n}') for n in range(2)]
+        cls.phone, cls.case = [
+            Product.objects.create(name=name, category=category) for name in ('Смартфон', 'Чехол')
+        ]
+        cls.infos = {
+            (shop, product): ProductInfo.objects.create(product=product, shop=shop, name='model', quantity=100,
+                                                        price=price, price_rrc=price)
+            for shop in cls.shops for product, price in ((cls.phone, 100), (cls.case, 10))
+        }
+        cls.user, cls.contact = create_buyer()
+        cls.staff = create_user('staff', is_staff=True)
+
+    def sales(self):
+        return {
+            'shops': set(ShopDailySales.objects.values_list('shop_id', 'revenue', 'units', 'orders')),
+            'products': set(ProductDailySales.objects.values_list('shop_id', 'product_id', 'revenue', 'units',
+                                                                  'orders')),
+        }
+
+    def test_rollups_follow_checkout_and_cancel(self):
+        first, second = self.shops
+        self.checkout((self.infos[first, self.phone], 2), (self.infos[first, self.case], 1),
+                      (self.infos[second, self.case], 3))
+        canceled = self.checkout((self.infos[first, self.phone], 1)).json()['id']
+        self.assertEqual(self.sales()['shops'], {(first.pk, Decimal(310), 4, 2), (second.pk, Decimal(30), 3, 1)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/orders/bulk_status/', {'ids': [canceled], 'status': 'canceled'},
+                             content_type='application/json', **self.auth(self.staff))
+        self.assertEqual(self.sales(), {
+            'shops': {(first.pk, Decimal(210), 3, 1), (second.pk, Decimal(30), 3, 1)},
+            'products': {
+                (first.pk, self.phone.pk, Decimal(200), 2, 1),
+                (first.pk, self.case.pk, Decimal(10), 1, 1),
+                (second.pk, self.case.pk, Decimal(30), 3, 1),
+            },
+        })
+        self.assertTrue(ShopDailySales.objects.filter(day=timezone_now().date()).exists())
+
+    def test_dashboard_reads_rollups_only(self):
+        first, second = self.shops
+        self.checkout((self.infos[first, self.phone], 2), (self.infos[second, self.case], 3))
+        auth = self.auth(self.staff)
+        with self.assertNumQueries(2):
+            daily = self.client.get('/reports/sales/', **auth).json()
+        self.assertEqual(daily['totals'], {'revenue': '230.00', 'units': 5, 'orders': 2})
+        self.assertEqual([row['shop__name'] for row in daily['results']], ['Магазин 0', 'Магазин 1'])
+
+        top = self.client.get(f'/reports/sales/products/?limit=1&shop={second.pk}', **auth).json()['results']
+        self.assertEqual(top, [{'product_id': self.case.pk, 'product__name': 'Чехол', 'shop_id': second.pk,
+                                'shop__name': 'Магазин 1', 'revenue': '30.00', 'units': 3, 'orders': 1}])
+        self.assertEqual(self.client.get('/reports/sales/?date_from=2000-01-01&date_to=2000-01-31',
+                                         **auth).json()['results'], [])
+        self.assertEqual(self.client.get('/reports/sales/?date_from=вчера', **auth).status_code, 400)
+        self.assertEqual(self.client.get('/reports/sales/', **self.auth(self.user)).status_code, 403)
+
+
+class SalesRollupRebuildTests(TransactionTestCase):
+    def test_rebuild_in_parallel_chunks_counts_live_and_archived_sales(self):
+        info = create_offer(quantity=100, price_rrc=100)
+        shop = info.shop
+        for n, status in enumerate(['new', 'processing', 'delivered', 'canceled', 'delivered'] * 3):
+            order = Order.objects.create(status=status)
+            OrderItem.objects.create(order=order, product_info=info, quantity=n + 1, price=100)
+        Order.objects.filter(status='delivered').update(created_at=timezone_now() - timedelta(days=400))
+        call_command('archive_orders', stdout=StringIO())
+        self.assertEqual(ArchivedOrder.objects.count(), 6)
+        ShopDailySales.objects.create(shop=shop, day=timezone_now().date(), revenue=1, units=1, orders=1)
+
+        out = StringIO()
+        call_command('rebuild_sales_rollups', '--chunk-size=2', '--workers=3', stdout=out)
+        self.assertIn('Сводки продаж пересчитаны', out.getvalue())
+
+        sold = [n + 1 for n, status in enumerate(['new', 'processing', 'delivered', 'canceled', 'delivered'] * 3)
+                if status != 'canceled']
+        shop_rows = ShopDailySales.objects.filter(shop=shop)
+        self.assertEqual(shop_rows.aggregate(units=Sum('units'), orders=Sum('orders'), revenue=Sum('revenue')),
+                         {'units': sum(sold), 'orders': len(sold), 'revenue': 100 * sum(sold)})
+        self.assertEqual(shop_rows.count(), 2)
+        self.assertEqual(ProductDailySales.objects.aggregate(units=Sum('units'))['units'], sum(sold))
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import Order, OrderStatusHistory
+from .reservations import close_reservations, commit_reservations, release_reservations
+from .rollups import record_sales
+
+
+def allowed_sources(status):
+    """Статусы, из которых разрешён переход в status."""
+    return [source for source, targets in Order.TRANSITIONS.items() if status in targets]
+
+
+def transition_orders(order_ids, status, note=''):
+    """
+    Переводит заказы в status одной транзакцией: один условный UPDATE,
+    история одной вставкой. Возвращает {id: ('updated' | 'conflict' |
+    'not_found', статус до перехода)}; конфликт — переход из текущего
+    статуса не разрешён.
+    """
+    order_ids = sorted(set(order_ids))
+    sources = allowed_sources(status)
+    with transaction.atomic():
+        # Блокировка по возрастанию id, как и у резервов: встречные массовые
+        # переходы не заблокируют друг друга, а истечение резервов пропустит
+        # эти заказы (SKIP LOCKED).
+        current = dict(Order.objects.select_for_update().filter(pk__in=order_ids).order_by('pk').values_list(
+            'pk', 'status'))
+        eligible = [pk for pk, source in current.items() if source in sources]
+        if eligible:
+            Order.objects.filter(pk__in=eligible, status__in=sources).update(
+                status=status, version=F('version') + 1,
+            )
+            if status == 'canceled':
+                release_reservations(eligible)
+                record_sales(eligible, -1)
+            elif status == 'processing':
+                commit_reservations(eligible)
+            else:
+                close_reservations(eligible)
+            OrderStatusHistory.objects.bulk_create([
+                OrderStatusHistory(order_id=pk, status=status, note=note) for pk in eligible
+            ])
+
+    eligible = set(eligible)
+    return {
+        pk: ('updated' if pk in eligible else 'conflict' if pk in current else 'not_found', current.get(pk))
+        for pk in order_ids
+    }
@@ -1,20 +1,44 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
 from django.contrib.auth import authenticate, get_user_model
 from rest_framework import generics, status, viewsets, mixins, permissions
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.authtoken.models import Token
 from django.shortcuts import get_object_or_404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db import transaction
+from django.db.models import F, Prefetch, Sum
 from .models import (
-    ProductInfo, Cart, CartItem, Contact, Order, OrderItem, OrderStatusHistory, User
+    Shop, ProductInfo, BestOffer, Cart, CartItem, Contact, Order, OrderItem, OrderStatusHistory, User,
+    ArchivedOrder, ArchivedOrderStatusHistory, ShopDailySales, ProductDailySales,
 )
+from .autocomplete import autocomplete
+from .cache import CatalogCacheMixin
+from .changes import changes_since
+from .etags import conditional_response, make_etag
+from .export import EXPORT_FORMATS, export_lines, export_queryset, export_rows, parse_changed_since
+from .facets import facet_counts, filter_by_parameters, parameter_filters
+from .pagination import KeysetPagination
+from .prices import apply_price_updates
+from .reservations import OutOfStock, reserve_stock
+from .rollups import record_sales
+from .search import search_product_infos
 from .serializers import (
     RegisterSerializer, AuthSerializer,
-    ProductInfoSerializer, CartSerializer, CartItemSerializer,
-    ContactSerializer, OrderSerializer, CreateOrderSerializer
+    ProductInfoSerializer, BestOfferSerializer, PriceUpdateSerializer, CartSerializer, CartItemSerializer,
+    ContactSerializer, OrderSerializer, CreateOrderSerializer, BulkStatusSerializer, order_snapshot,
+    PRODUCT_INFO_VALUES, serialize_product_info_rows
 )
+from .transitions import transition_orders
 
 User = get_user_model()
 
@@ -38,22 +62,264 @@ def login_view(request):
     return Response({'token': token.key})
 
 # --- Products ---
-class ProductInfoListView(generics.ListAPIView):
+class ProductInfoListView(CatalogCacheMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = ProductInfoSerializer
-    queryset = ProductInfo.objects.select_related('product', 'shop').prefetch_related('product_parameters')
+    pagination_class = KeysetPagination
+    queryset = ProductInfo.objects.all()
+
+    def get_catalog_shop_id(self):
+        shop = self.request.query_params.get('shop', '')
+        return int(shop) if shop.isdigit() else None
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = super().get_queryset().order_by('id')
+        shop_id = self.get_catalog_shop_id()
+        if shop_id is not None:
+            qs = qs.filter(shop_id=shop_id)
+        qs = filter_by_parameters(qs, parameter_filters(self.request.query_params))
         search = self.request.query_params.get('search')
         if search:
-            qs = qs.filter(product__name__icontains=search)
+            qs = search_product_infos(qs, search)
         return qs
 
-class ProductInfoDetailView(generics.RetrieveAPIView):
+    def list(self, request, *args, **kwargs):
+        # Ответ в формате ProductInfoSerializer, но без экземпляров моделей:
+        # страница строк и параметры к ней — два запроса при любом page_size.
+        qs = self.filter_queryset(self.get_queryset())
+        rows = self.paginate_queryset(qs.values(*PRODUCT_INFO_VALUES, 'version', *qs.query.annotations))
+        # ETag страницы — из id и версий её строк; при совпадении
+        # параметры не выбираются и ответ не собирается.
+        etag = make_etag('product_infos', self.paginator.get_next_link(),
+                         *(f"{row['id']}.{row['version']}" for row in rows))
+        response = conditional_response(request, etag)
+        if response is None:
+            response = self.get_paginated_response(serialize_product_info_rows(rows))
+            response['ETag'] = etag
+        return response
+
+class ProductFacetsView(ProductInfoListView):
+    """Значения параметров со счётчиками для текущей выдачи (те же фильтры, что у списка)."""
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        filtered = bool(request.query_params.get('search') or parameter_filters(request.query_params))
+        qs = self.filter_queryset(self.get_queryset())
+        return Response(facet_counts(qs, self.get_catalog_shop_id(), filtered))
+
+class ProductInfoBatchView(CatalogCacheMixin, generics.ListAPIView):
+    """
+    Несколько карточек за один запрос: ?ids=1,2,3. Ответ — карточки по id
+    и список id, которых нет; строки выбираются одним запросом.
+    """
     permission_classes = [AllowAny]
     serializer_class = ProductInfoSerializer
-    queryset = ProductInfo.objects.select_related('product', 'shop').prefetch_related('product_parameters')
+    queryset = ProductInfo.objects.all()
+    max_ids = KeysetPagination.max_page_size
+
+    def get_ids(self):
+        raw = [value for value in self.request.query_params.get('ids', '').split(',') if value.strip()]
+        if not all(value.strip().isdigit() for value in raw):
+            raise ValidationError({'ids': 'Ожидается список id через запятую'})
+        ids = list(dict.fromkeys(int(value) for value in raw))
+        if len(ids) > self.max_ids:
+            raise ValidationError({'ids': f'Не больше {self.max_ids} id за запрос'})
+        return ids
+
+    def list(self, request, *args, **kwargs):
+        ids = self.get_ids()
+        rows = list(self.get_queryset().filter(id__in=ids).values(*PRODUCT_INFO_VALUES, 'version'))
+        etag = make_etag('product_infos_batch', *sorted(f"{row['id']}.{row['version']}" for row in rows))
+        response = conditional_response(request, etag)
+        if response is None:
+            results = {str(item['id']): item for item in serialize_product_info_rows(rows)}
+            missing = [pk for pk in ids if str(pk) not in results]
+            response = Response({'results': results, 'missing': missing}, headers={'ETag': etag})
+        return response
+
+class BestOfferListView(CatalogCacheMixin, generics.ListAPIView):
+    """Лучшие предложения по продуктам — только из предрасчитанной таблицы BestOffer."""
+    permission_classes = [AllowAny]
+    serializer_class = BestOfferSerializer
+    pagination_class = KeysetPagination
+    queryset = BestOffer.objects.order_by('pk')
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def autocomplete_view(request):
+    # Подсказки из индекса в памяти процесса, без запросов к БД.
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    return Response({'results': autocomplete.search(request.query_params.get('q', ''), limit)})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def changes_view(request):
+    """
+    Лента изменений каталога: ?since=<seq>&page_size=N. Клиент запоминает
+    since из ответа и повторяет запрос, пока has_more.
+    """
+    since = request.query_params.get('since', '0')
+    if not since.isdigit():
+        raise ValidationError({'since': 'Ожидается номер изменения'})
+    limit = KeysetPagination().get_page_size(request)
+    changes, has_more = changes_since(int(since), limit)
+    return Response({
+        'since': changes[-1]['seq'] if changes else int(since),
+        'has_more': has_more,
+        'results': changes,
+    })
+
+@require_GET
+def export_view(request):
+    """
+    Потоковая выгрузка каталога: ?format=ndjson|csv&shop=<id>&changed_since=<ISO 8601>.
+    Обычный Django view: DRF занимает параметр format под выбор рендерера.
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'format': f"Допустимые форматы: {', '.join(EXPORT_FORMATS)}"}, status=400)
+    shop = request.GET.get('shop', '')
+    if shop and not shop.isdigit():
+        return JsonResponse({'shop': 'Ожидается id магазина'}, status=400)
+    changed_since = None
+    if request.GET.get('changed_since'):
+        changed_since = parse_changed_since(request.GET['changed_since'])
+        if changed_since is None:
+            return JsonResponse({'changed_since': 'Ожидается дата или время в ISO 8601'}, status=400)
+
+    rows = export_rows(export_queryset(int(shop) if shop else None, changed_since))
+    content_type = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    response = StreamingHttpResponse(export_lines(export_format, rows), content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="catalog.{export_format}"'
+    return response
+
+class ProductInfoDetailView(CatalogCacheMixin, generics.RetrieveAPIView):
+    permission_classes = [AllowAny]
+    serializer_class = ProductInfoSerializer
+    queryset = ProductInfo.objects.select_related('product__category', 'shop')
+
+    def get_row_version(self):
+        if not hasattr(self, '_row_version'):
+            self._row_version = ProductInfo.objects.filter(pk=self.kwargs[self.lookup_field]).values_list(
+                'version', flat=True).first()
+        return self._row_version
+
+    def get_catalog_version(self):
+        # Карточка зависит только от своей строки: ключ кэша — версия строки,
+        # и заказы по другим строкам закэшированные карточки не сбрасывают.
+        return f'row:{self.get_row_version()}'
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_field]
+        version = self.get_row_version()
+        if version is None:
+            raise Http404
+        etag = make_etag('product_info', pk, version)
+        response = conditional_response(request, etag)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+            response['ETag'] = etag
+        return response
+
+# --- Shops ---
+class ShopPriceUpdateView(generics.GenericAPIView):
+    """
+    Массовое обновление цен и остатков магазина без загрузки прайса:
+    {"items": [{"product_id": 1, "price": "10.00", "price_rrc": "12.00", "quantity": 5}, ...]}.
+    Результат — статус по каждой строке в порядке запроса.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = PriceUpdateSerializer
+    max_items = 10000
+
+    def post(self, request, pk):
+        shop = get_object_or_404(Shop, pk=pk)
+        if not (request.user.is_staff or shop.user_id == request.user.id):
+            return Response({'detail': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'items': 'Ожидается непустой список'})
+        if len(items) > self.max_items:
+            raise ValidationError({'items': f'Не больше {self.max_items} строк за запрос'})
+
+        results = []
+        updates = {}
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if not serializer.is_valid():
+                results.append({'index': index, 'status': 'invalid', 'errors': serializer.errors})
+                continue
+            product_id = serializer.validated_data['product_id']
+            if product_id in updates:
+                results.append({'index': index, 'product_id': product_id, 'status': 'duplicate'})
+                continue
+            updates[product_id] = serializer.validated_data
+            results.append({'index': index, 'product_id': product_id})
+
+        statuses = apply_price_updates(shop, list(updates.values())) if updates else {}
+        for result in results:
+            result.setdefault('status', statuses.get(result.get('product_id')))
+        return Response({
+            'updated': sum(result['status'] == 'updated' for result in results),
+            'results': results,
+        })
+
+# --- Reports ---
+def report_filters(request):
+    """
+    ?date_from=&date_to= (включительно, по умолчанию — последние 30 дней)
+    и ?shop=<id>: фильтр по строкам сводок продаж.
+    """
+    today = timezone.localdate()
+    period = {}
+    for param, default in (('date_from', today - timedelta(days=29)), ('date_to', today)):
+        value = request.query_params.get(param)
+        period[param] = parse_date(value) if value else default
+        if period[param] is None:
+            raise ValidationError({param: 'Ожидается дата в формате ГГГГ-ММ-ДД'})
+    filters = {'day__gte': period['date_from'], 'day__lte': period['date_to']}
+    shop = request.query_params.get('shop')
+    if shop is not None:
+        if not shop.isdigit():
+            raise ValidationError({'shop': 'Ожидается id магазина'})
+        filters['shop_id'] = int(shop)
+    return filters
+
+def sales_row(row):
+    return {**row, 'revenue': str(row['revenue'])}
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_daily_view(request):
+    """Продажи магазинов по дням из сводок и итог за период."""
+    rows = list(ShopDailySales.objects.filter(**report_filters(request)).order_by('day', 'shop_id').values(
+        'day', 'shop_id', 'shop__name', 'revenue', 'units', 'orders',
+    ))
+    return Response({
+        'results': [sales_row(row) for row in rows],
+        'totals': sales_row({
+            'revenue': sum((row['revenue'] for row in rows), Decimal(0)),
+            'units': sum(row['units'] for row in rows),
+            'orders': sum(row['orders'] for row in rows),
+        }),
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_products_view(request):
+    """Самые продаваемые товары за период по выручке: ?limit=N (по умолчанию 20)."""
+    limit = request.query_params.get('limit', '20')
+    if not limit.isdigit() or not 0 < int(limit) <= KeysetPagination.max_page_size:
+        raise ValidationError({'limit': f'Ожидается число от 1 до {KeysetPagination.max_page_size}'})
+    rows = ProductDailySales.objects.filter(**report_filters(request)).values(
+        'product_id', 'product__name', 'shop_id', 'shop__name',
+    ).annotate(
+        revenue=Sum('revenue'), units=Sum('units'), orders=Sum('orders'),
+    ).order_by('-revenue', 'product_id', 'shop_id')[:int(limit)]
+    return Response({'results': [sales_row(row) for row in rows]})
 
 # --- Cart ---
 class CartView(generics.RetrieveAPIView):
@@ -101,41 +367,107 @@ class ContactViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 # --- Orders ---
-class OrderViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.RetrieveModelMixin):
-    permission_classes = [IsAuthenticated]
-    serializer_class = OrderSerializer
+class OrderETagMixin:
+    """
+    retrieve с ETag из версии заказа. Позиции и контакт отдаются из снимка
+    и после оформления не меняются, так что версии самого заказа достаточно.
+    """
 
-    def get_queryset(self):
-        if self.request.user.is_staff:
-            return Order.objects.all()
-        return Order.objects.filter(user=self.request.user)
+    def retrieve(self, request, *args, **kwargs):
+        order = self.get_object()
+        etag = make_etag('order', order.pk, order.version)
+        response = conditional_response(request, etag)
+        if response is None:
+            response = Response(self.get_serializer(order).data, headers={'ETag': etag})
+        return response
+
+def order_details(queryset):
+    """Всё, что читает OrderSerializer, помимо самого заказа, — одним запросом на страницу."""
+    return queryset.prefetch_related(
+        Prefetch('status_history', queryset=OrderStatusHistory.objects.order_by('id')),
+    )
+
+def archived_order_details(queryset):
+    return queryset.prefetch_related(
+        Prefetch('status_history', queryset=ArchivedOrderStatusHistory.objects.order_by('id')),
+    )
+
+class OrderArchiveMixin:
+    """
+    Заказы, перенесённые в архив (backend.archive), читаются по тем же
+    адресам: retrieve ищет заказ в архиве, если среди живых его нет, а
+    list с ?archived=1 листает архив.
+    """
+
+    def get_archive_queryset(self):
+        queryset = ArchivedOrder.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return archived_order_details(queryset)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action != 'retrieve':
+                raise
+        order = generics.get_object_or_404(self.get_archive_queryset(), pk=self.kwargs[self.lookup_field])
+        self.check_object_permissions(self.request, order)
+        return order
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('archived') not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(self.get_archive_queryset())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+class OrderWorkflowMixin:
+    """Оформление заказа из корзины и смена статуса персоналом."""
 
     @action(detail=False, methods=['post'])
     def create_from_cart(self, request):
         ser = CreateOrderSerializer(data=request.data)
         ser.is_valid(raise_exception=True)
-        cart = get_object_or_404(Cart, pk=ser.validated_data['cart_id'], user=request.user)
+        # Корзина, её строки и сумма — двумя запросами при любом размере
+        # корзины; сумма считается в базе.
+        carts = Cart.objects.filter(user=request.user).prefetch_related('items').annotate(
+            total=Sum(F('items__quantity') * F('items__price')),
+        )
+        cart = get_object_or_404(carts, pk=ser.validated_data['cart_id'])
         contact = get_object_or_404(Contact, pk=ser.validated_data['contact_id'], user=request.user)
 
-        if not cart.items.exists():
+        items = cart.items.all()
+        if not items:
             return Response({'detail': 'Cart is empty'}, status=400)
 
-        with transaction.atomic():
-            order = Order.objects.create(
-                user=request.user,
-                contact=contact,
-                total=sum(i.quantity * i.price for i in cart.items.all()),
-                status='new'
-            )
-            for item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product_info=item.product_info,
-                    quantity=item.quantity,
-                    price=item.price
+        quantities = defaultdict(int)
+        for item in items:
+            quantities[item.product_info_id] += item.quantity
+
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=request.user,
+                    contact=contact,
+                    total=cart.total,
+                    status='new'
                 )
-            OrderStatusHistory.objects.create(order=order, status='new')
-            cart.items.all().delete()
+                order_items = OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product_info_id=item.product_info_id, quantity=item.quantity,
+                              price=item.price)
+                    for item in items
+                ])
+                order.snapshot = order_snapshot(contact, order_items)
+                Order.objects.filter(pk=order.pk).update(snapshot=order.snapshot)
+                # Резерв — последним шагом: строки остатков заблокированы
+                # только до коммита, и чем короче хвост транзакции, тем меньше
+                # ждут параллельные оформления того же товара.
+                reserve_stock(order, quantities)
+                record_sales([order.pk])
+                OrderStatusHistory.objects.create(order=order, status='new')
+                CartItem.objects.filter(cart=cart).delete()
+        except OutOfStock as exc:
+            return Response({'detail': str(exc), 'shortages': exc.shortages}, status=409)
 
         return Response(OrderSerializer(order).data, status=201)
 
@@ -143,14 +475,55 @@ class OrderViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Retrie
     def change_status(self, request, pk=None):
         if not request.user.is_staff:
             return Response({'detail': 'Permission denied'}, status=403)
-        order = self.get_object()
-        new_status = request.data.get('status')
-        note = request.data.get('note', '')
-        order.status = new_status
-        order.save()
-        OrderStatusHistory.objects.create(order=order, status=new_status, note=note)
+        ser = BulkStatusSerializer(data={
+            'ids': [pk], 'status': request.data.get('status'), 'note': request.data.get('note', ''),
+        })
+        ser.is_valid(raise_exception=True)
+        order_id, new_status = ser.validated_data['ids'][0], ser.validated_data['status']
+        result, current = transition_orders([order_id], new_status, ser.validated_data['note'])[order_id]
+        if result == 'not_found':
+            return Response({'detail': 'Заказ не найден'}, status=404)
+        if result == 'conflict':
+            return Response({'detail': f'Недопустимый переход: {current} → {new_status}'}, status=409)
+        order = order_details(Order.objects.filter(pk=order_id)).get()
         return Response(OrderSerializer(order).data)
 
+    @action(detail=False, methods=['post'])
+    def bulk_status(self, request):
+        """
+        Смена статуса списка заказов одной транзакцией. Для каждого заказа
+        в ответе updated, conflict (переход из текущего статуса запрещён)
+        или not_found.
+        """
+        if not request.user.is_staff:
+            return Response({'detail': 'Permission denied'}, status=403)
+        ser = BulkStatusSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        outcome = transition_orders(ser.validated_data['ids'], ser.validated_data['status'],
+                                    ser.validated_data['note'])
+        results = []
+        for pk, (result, current) in outcome.items():
+            row = {'id': pk, 'result': result}
+            if result == 'conflict':
+                row['status'] = current
+            results.append(row)
+        return Response({
+            'updated': sum(result == 'updated' for result, _ in outcome.values()),
+            'results': results,
+        })
+
+# Только чтение и действия: статус меняют лишь change_status/bulk_status
+# (Order.TRANSITIONS, резервы, сводки, история), удалять заказы нельзя.
+class OrderViewSet(OrderWorkflowMixin, OrderArchiveMixin, OrderETagMixin, viewsets.GenericViewSet, mixins.ListModelMixin, mixins.RetrieveModelMixin):
+    permission_classes = [IsAuthenticated]
+    serializer_class = OrderSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return order_details(Order.objects.all())
+        return order_details(Order.objects.filter(user=self.request.user))
+
 
 
 @api_view(['GET'])
@@ -166,22 +539,6 @@ def confirm_email(request):
         return Response({'detail': 'Неверный токен подтверждения'}, status=400)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
-    serializer_class = OrderSerializer
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get_queryset(self):
-        # Возвращаем только заказы текущего пользователя
-        return Order.objects.filter(user=self.request.user)
-
-    @action(detail=True, methods=['post'])
-    def confirm(self, request, pk=None):
-        # Пример дополнительного действия — подтверждение заказа
-        order = self.get_object()
-        order.status = 'confirmed'  # или нужный статус
-        order.save()
-        return Response({'status': 'order confirmed'})
-
 class CustomAuthToken(ObtainAuthToken):
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data,
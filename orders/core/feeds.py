@@ -0,0 +1,61 @@
+import time
+
+import requests
+from django.db import connection, transaction
+from requests.adapters import HTTPAdapter
+
+from core.importer import BulkImporter
+from core.price_list import PriceListReader
+
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def conditional_headers(shop):
+    headers = {}
+    if shop.feed_etag:
+        headers['If-None-Match'] = shop.feed_etag
+    if shop.feed_last_modified:
+        headers['If-Modified-Since'] = shop.feed_last_modified
+    return headers
+
+
+def fetch_and_import(session, shop, timeout=30, batch_size=1000, force=False, keep_missing=False):
+    """
+    Скачивает прайс магазина с Shop.url условным GET и, если он изменился,
+    импортирует его прямо из тела ответа, не сохраняя файл целиком.
+    Вызывается из рабочего потока, поэтому соединение с БД закрывается здесь же.
+    """
+    started = time.perf_counter()
+    try:
+        headers = {} if force else conditional_headers(shop)
+        with session.get(shop.url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                return {'shop': shop.name, 'status': 'not_modified',
+                        'elapsed': time.perf_counter() - started}
+            response.raise_for_status()
+            response.raw.decode_content = True
+
+            importer = BulkImporter(batch_size=batch_size, lock_on_insert=True)
+            reader = PriceListReader(response.raw)
+            try:
+                header = reader.read_header()
+                with transaction.atomic():
+                    importer.import_categories(shop, header['categories'])
+                    imported = importer.import_goods(shop, reader.goods())
+                    if not keep_missing:
+                        importer.zero_missing(shop)
+                    shop.feed_etag = response.headers.get('ETag', '')
+                    shop.feed_last_modified = response.headers.get('Last-Modified', '')
+                    shop.save(update_fields=['feed_etag', 'feed_last_modified'])
+            finally:
+                reader.close()
+        return {'shop': shop.name, 'status': 'imported', 'goods': imported, 'stats': importer.stats,
+                'elapsed': time.perf_counter() - started}
+    finally:
+        connection.close()
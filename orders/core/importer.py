@@ -0,0 +1,444 @@
+import hashlib
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, transaction
+
+from backend.models import (
+    Shop, Category, Product, ProductInfo, Parameter, ProductParameter, product_info_changes,
+    product_info_params,
+)
+from backend.cache import bump_autocomplete_version
+from backend.changes import record_changes
+from backend.facets import add_to_facets, remove_from_facets
+from backend.offers import refresh_catalog_on_commit
+from backend.search import refresh_search_text
+
+PRICE_QUANT = Decimal('0.01')
+
+# Ключ pg_advisory_xact_lock для записи в общие справочники
+# (Shop, Category, Product, Parameter) при параллельном импорте.
+SHARED_TABLES_LOCK = 0x6e66_0001
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def to_price(value):
+    return Decimal(str(value)).quantize(PRICE_QUANT)
+
+
+def fingerprint(data):
+    """Отпечаток содержимого товара: всё, что импорт пишет в ProductInfo и ProductParameter."""
+    parameters = sorted((str(name), str(value)) for name, value in data.get('parameters', {}).items())
+    content = repr((
+        str(data['model']), str(to_price(data['price'])), str(to_price(data['price_rrc'])),
+        int(data['quantity']), parameters,
+    ))
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def lock_shared_tables():
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SHARED_TABLES_LOCK])
+
+
+class ImportStats:
+    """Счётчики строк по моделям и время выполнения по фазам импорта."""
+
+    def __init__(self):
+        self.rows = defaultdict(Counter)
+        self.timings = defaultdict(float)
+        self.skipped = 0
+        # Дифф прайса относительно прошлого импорта: new / changed / unchanged / removed
+        self.goods = Counter()
+
+    def count(self, model, inserted=0, updated=0, unchanged=0, deleted=0):
+        counter = self.rows[model.__name__]
+        counter['inserted'] += inserted
+        counter['updated'] += updated
+        counter['unchanged'] += unchanged
+        counter['deleted'] += deleted
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - started
+
+    def total(self, key):
+        return sum(counter[key] for counter in self.rows.values())
+
+    @property
+    def processed(self):
+        return sum(sum(counter.values()) for counter in self.rows.values())
+
+
+class BulkImporter:
+    """
+    Импорт прайс-листа магазина пачками: существующие строки находятся
+    несколькими запросами на пачку, запись идёт через bulk_create с
+    update_conflicts по уникальным ограничениям моделей.
+
+    Товары, чей отпечаток совпадает с сохранённым в ProductInfo.fingerprint,
+    не перезаписываются. При dry_run считается только дифф, без записи.
+    """
+
+    def __init__(self, batch_size=1000, warn=None, dry_run=False, lock_on_insert=False):
+        self.batch_size = batch_size
+        self.warn = warn
+        self.dry_run = dry_run
+        # Однопроходный импорт в общей транзакции: перед вставкой в общие
+        # справочники берётся advisory-блокировка до конца транзакции.
+        # Пока новых строк нет, параллельные импорты друг друга не ждут.
+        self.lock_on_insert = lock_on_insert
+        self.stats = ImportStats()
+        self.category_ids = set()
+        self.parameter_ids = {}
+        self.seen_products = set()
+        # Продукты, у которых менялись цены или остатки: для пересчёта BestOffer.
+        self.offer_products = set()
+        # После import_shared справочники уже созданы и посчитаны в stats.
+        self.shared_ready = False
+
+    def import_shared(self, shop_name, categories, goods):
+        """
+        Создаёт магазин, категории, продукты и параметры короткими
+        транзакциями под advisory-блокировкой, до основной транзакции
+        магазина. Параллельные импорты не создают дубликатов и не ждут
+        друг друга на уникальных индексах общих таблиц.
+        """
+        with transaction.atomic():
+            lock_shared_tables()
+            shop = self.import_shop(shop_name)
+            self._write_categories(categories)
+        for chunk in chunked(goods, self.batch_size):
+            valid = self._filter_goods(chunk, report=False)
+            if valid:
+                with transaction.atomic():
+                    lock_shared_tables()
+                    self._write_products(valid)
+                    self._write_parameters(valid)
+        self.shared_ready = True
+        return shop
+
+    def import_shop(self, name):
+        if self.dry_run:
+            return Shop.objects.filter(name=name).first() or Shop(name=name)
+        with self.stats.phase('shop'):
+            shop, created = Shop.objects.get_or_create(name=name, defaults={'url': ''})
+        self.stats.count(Shop, inserted=int(created), unchanged=int(not created))
+        return shop
+
+    def import_categories(self, shop, categories):
+        if self.dry_run:
+            self.category_ids.update(category['id'] for category in categories)
+            return
+        if not self.shared_ready:
+            self._write_categories(categories)
+        with self.stats.phase('categories'):
+            through = Category.shops.through
+            through.objects.bulk_create(
+                [through(category_id=pk, shop_id=shop.pk) for pk in self.category_ids],
+                batch_size=self.batch_size, ignore_conflicts=True,
+            )
+
+    def _write_categories(self, categories):
+        with self.stats.phase('categories'):
+            names = {category['id']: category['name'] for category in categories}
+            existing = set(Category.objects.filter(id__in=names).values_list('id', flat=True))
+            missing = [Category(id=pk, name=name) for pk, name in names.items() if pk not in existing]
+            if missing and self.lock_on_insert:
+                lock_shared_tables()
+            Category.objects.bulk_create(missing, batch_size=self.batch_size, ignore_conflicts=True)
+            self.category_ids.update(names)
+        self.stats.count(Category, inserted=len(missing), unchanged=len(existing))
+
+    def import_goods(self, shop, goods):
+        if not self.dry_run:
+            # Кэш каталога и лучшие предложения увидят новые данные только
+            # после коммита; offer_products дополняется и в zero_missing.
+            refresh_catalog_on_commit([shop.pk], self.offer_products, self.batch_size)
+            transaction.on_commit(bump_autocomplete_version)
+        imported = 0
+        for chunk in chunked(goods, self.batch_size):
+            imported += self.write_chunk(shop, chunk)
+        return imported
+
+    def write_chunk(self, shop, goods):
+        valid = self._filter_goods(goods)
+        if not valid:
+            return 0
+
+        product_ids = self._write_products(valid)
+        changed, info_ids = self._diff_goods(shop, valid, product_ids)
+        if changed and not self.dry_run:
+            with self.stats.phase('facets'):
+                # Старые значения изменённых товаров уходят из счётчиков до перезаписи.
+                remove_from_facets(info_ids.values())
+            info_ids = self._write_product_infos(shop, changed, product_ids, info_ids)
+            parameter_ids = self._write_parameters(changed)
+            self._write_product_parameters(changed, product_ids, info_ids, parameter_ids)
+            with self.stats.phase('facets'):
+                add_to_facets(info_ids.values())
+            self.offer_products.update(info_ids.keys())
+            with self.stats.phase('changes'):
+                record_changes(info_ids.values())
+            with self.stats.phase('search'):
+                refresh_search_text(info_ids.values())
+        return len(valid)
+
+    def zero_missing(self, shop):
+        """Обнуляет остаток товаров магазина, которых не было в прайсе."""
+        if shop.pk is None:
+            return 0
+        with self.stats.phase('missing'):
+            missing = {
+                pk: product_id for pk, product_id in ProductInfo.objects.filter(shop=shop).exclude(
+                    quantity=0).values_list('id', 'product_id').iterator(chunk_size=self.batch_size)
+                if product_id not in self.seen_products
+            }
+            if not self.dry_run:
+                self.offer_products.update(missing.values())
+                for chunk in chunked(missing, self.batch_size):
+                    # Сбрасываем отпечаток: вернувшийся в прайс товар будет записан заново.
+                    ProductInfo.objects.filter(id__in=chunk).update(
+                        quantity=0, fingerprint='', **product_info_changes())
+                    record_changes(chunk)
+        self.stats.goods['removed'] += len(missing)
+        return len(missing)
+
+    def _filter_goods(self, goods, report=True):
+        valid = {}
+        for product_data in goods:
+            if product_data['category'] not in self.category_ids:
+                if report:
+                    self.stats.skipped += 1
+                    if self.warn:
+                        self.warn(f"Категория с id {product_data['category']} не найдена, "
+                                  f"пропускаем товар {product_data['name']}")
+                continue
+            valid[product_data['id']] = product_data
+        return valid
+
+    def _write_products(self, goods):
+        # Как и раньше, существующий продукт не перезаписывается: имя и
+        # категория берутся из прайса только при создании.
+        with self.stats.phase('products'):
+            existing = set(Product.objects.filter(id__in=goods).values_list('id', flat=True))
+            missing = [
+                Product(id=pk, name=data['name'], category_id=data['category'])
+                for pk, data in goods.items() if pk not in existing
+            ]
+            if missing and self.lock_on_insert and not self.dry_run:
+                lock_shared_tables()
+            if not self.dry_run:
+                Product.objects.bulk_create(missing, batch_size=self.batch_size, ignore_conflicts=True)
+
+            product_ids = {pk: pk for pk in existing}
+            created = set(Product.objects.filter(id__in=[p.id for p in missing]).values_list('id', flat=True))
+            product_ids.update((pk, pk) for pk in created)
+
+            # Продукт с тем же (name, category) уже заведён под другим id:
+            # используем его, а не создаём дубликат.
+            conflicting = {
+                (p.name, p.category_id): p.id for p in missing if p.id not in created
+            }
+            if conflicting:
+                rows = Product.objects.filter(
+                    name__in={name for name, _ in conflicting},
+                    category_id__in={category for _, category in conflicting},
+                ).values_list('name', 'category_id', 'id')
+                for name, category_id, pk in rows:
+                    feed_id = conflicting.get((name, category_id))
+                    if feed_id is not None:
+                        product_ids[feed_id] = pk
+        if not self.shared_ready:
+            self.stats.count(Product, inserted=len(created), unchanged=len(product_ids) - len(created))
+        return product_ids
+
+    def _diff_goods(self, shop, goods, product_ids):
+        with self.stats.phase('diff'):
+            existing = {}
+            if shop.pk is not None:
+                existing = {
+                    product_id: (pk, stored)
+                    for product_id, pk, stored in ProductInfo.objects.filter(
+                        shop=shop, product_id__in=product_ids.values()
+                    ).values_list('product_id', 'id', 'fingerprint')
+                }
+            changed = {}
+            info_ids = {}
+            for feed_id, data in goods.items():
+                product_id = product_ids.get(feed_id)
+                current = existing.get(product_id)
+                if current is None:
+                    self.stats.goods['new'] += 1
+                elif current[1] == fingerprint(data):
+                    self.stats.goods['unchanged'] += 1
+                    continue
+                else:
+                    self.stats.goods['changed'] += 1
+                    info_ids[product_id] = current[0]
+                changed[feed_id] = data
+            self.seen_products.update(product_ids.values())
+        self.stats.count(ProductInfo, unchanged=len(goods) - len(changed))
+        return changed, info_ids
+
+    def _write_product_infos(self, shop, goods, product_ids, existing_ids):
+        with self.stats.phase('product_infos'):
+            # Ключ — id продукта в базе: два товара прайса могут сойтись
+            # на одном продукте, а ON CONFLICT не обновляет строку дважды.
+            rows = {}
+            for feed_id, data in goods.items():
+                if feed_id in product_ids:
+                    rows[product_ids[feed_id]] = ProductInfo(
+                        product_id=product_ids[feed_id], shop=shop, name=data['model'],
+                        price=to_price(data['price']), price_rrc=to_price(data['price_rrc']),
+                        quantity=int(data['quantity']), fingerprint=fingerprint(data),
+                        params=product_info_params(data.get('parameters', {})),
+                    )
+
+            ProductInfo.objects.bulk_create(
+                rows.values(), batch_size=self.batch_size,
+                update_conflicts=True, unique_fields=['product', 'shop'],
+                # version и updated_at не задаются: в VALUES уходит DEFAULT
+                # (nextval(...), now()), и EXCLUDED — новые значения и для обновлённых строк.
+                update_fields=['name', 'price', 'price_rrc', 'quantity', 'fingerprint', 'params',
+                               'version', 'updated_at'],
+            )
+            info_ids = {product_id: obj.pk for product_id, obj in rows.items() if obj.pk is not None}
+            if len(info_ids) < len(rows):
+                # Бэкенд не вернул первичные ключи (нет RETURNING) — дочитываем.
+                info_ids.update(ProductInfo.objects.filter(
+                    shop=shop, product_id__in=rows.keys() - info_ids.keys()
+                ).values_list('product_id', 'id'))
+        updated = len(rows.keys() & existing_ids.keys())
+        self.stats.count(ProductInfo, inserted=len(rows) - updated, updated=updated)
+        return info_ids
+
+    def _write_parameters(self, goods):
+        with self.stats.phase('parameters'):
+            names = {name for data in goods.values() for name in data.get('parameters', {})}
+            missing = names - self.parameter_ids.keys()
+            if not missing:
+                return self.parameter_ids
+
+            # У Parameter нет уникального ограничения на name, поэтому при
+            # дубликатах берём самую раннюю запись.
+            found = 0
+            for name, pk in Parameter.objects.filter(name__in=missing).order_by('-id').values_list('name', 'id'):
+                found += name not in self.parameter_ids
+                self.parameter_ids[name] = pk
+            if self.lock_on_insert and missing - self.parameter_ids.keys():
+                # Под блокировкой перечитываем: параметр мог создать другой импорт.
+                lock_shared_tables()
+                for name, pk in Parameter.objects.filter(
+                        name__in=missing - self.parameter_ids.keys()).order_by('-id').values_list('name', 'id'):
+                    found += name not in self.parameter_ids
+                    self.parameter_ids[name] = pk
+            created = Parameter.objects.bulk_create(
+                [Parameter(name=name) for name in sorted(missing - self.parameter_ids.keys())],
+                batch_size=self.batch_size,
+            )
+            if any(parameter.pk is None for parameter in created):
+                created = Parameter.objects.filter(name__in=[p.name for p in created])
+            for parameter in created:
+                self.parameter_ids.setdefault(parameter.name, parameter.pk)
+        if not self.shared_ready:
+            self.stats.count(Parameter, inserted=len(created), unchanged=found)
+        return self.parameter_ids
+
+    def _write_product_parameters(self, goods, product_ids, info_ids, parameter_ids):
+        with self.stats.phase('product_parameters'):
+            existing = {
+                (info_id, parameter_id): (pk, value)
+                for pk, info_id, parameter_id, value in ProductParameter.objects.filter(
+                    product_info_id__in=info_ids.values()
+                ).values_list('id', 'product_info_id', 'parameter_id', 'value')
+            }
+            rows = {}
+            for feed_id, data in goods.items():
+                info_id = info_ids.get(product_ids.get(feed_id))
+                if info_id is None:
+                    continue
+                for name, value in data.get('parameters', {}).items():
+                    rows[info_id, parameter_ids[name]] = str(value)
+
+            changed = []
+            inserted = updated = unchanged = 0
+            for key, value in rows.items():
+                current = existing.pop(key, None)
+                if current is None:
+                    inserted += 1
+                elif current[1] == value:
+                    unchanged += 1
+                    continue
+                else:
+                    updated += 1
+                changed.append(ProductParameter(product_info_id=key[0], parameter_id=key[1], value=value))
+
+            ProductParameter.objects.bulk_create(
+                changed, batch_size=self.batch_size,
+                update_conflicts=True, unique_fields=['product_info', 'parameter'],
+                update_fields=['value'],
+            )
+            # Оставшиеся параметры пропали из прайса у изменившихся товаров.
+            removed = [pk for pk, _ in existing.values()]
+            for chunk in chunked(removed, self.batch_size):
+                ProductParameter.objects.filter(id__in=chunk).delete()
+        self.stats.count(ProductParameter, inserted=inserted, updated=updated, unchanged=unchanged,
+                         deleted=len(removed))
+
+
+def import_price_list(path, batch_size=1000, dry_run=False, keep_missing=False):
+    """
+    Импорт одного файла в рабочем процессе пула: два потоковых прохода по
+    файлу — справочники, затем строки магазина в собственной транзакции.
+    """
+    from core.price_list import PriceListReader
+
+    started = time.perf_counter()
+    importer = BulkImporter(batch_size=batch_size, dry_run=dry_run)
+    with open(path, 'r', encoding='utf-8') as file:
+        reader = PriceListReader(file)
+        try:
+            header = reader.read_header()
+            if dry_run:
+                shop = importer.import_shop(header['shop'])
+            else:
+                shop = importer.import_shared(header['shop'], header['categories'], reader.goods())
+        finally:
+            reader.close()
+
+    with open(path, 'r', encoding='utf-8') as file:
+        reader = PriceListReader(file)
+        try:
+            reader.read_header()
+            with transaction.atomic():
+                importer.import_categories(shop, header['categories'])
+                imported = importer.import_goods(shop, reader.goods())
+                if not keep_missing:
+                    importer.zero_missing(shop)
+        finally:
+            reader.close()
+    return {
+        'path': os.fspath(path),
+        'shop': shop.name,
+        'goods': imported,
+        'stats': importer.stats,
+        'elapsed': time.perf_counter() - started,
+    }
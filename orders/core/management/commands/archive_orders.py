@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from backend.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Moves delivered and canceled orders older than the cutoff to the archive tables in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=365,
+                            help='Archive orders created more than this many days ago (default: 365)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Orders moved per transaction (default: 500)')
+        parser.add_argument('--max-chunks', type=int, help='Stop after this many chunks (default: until done)')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between chunks to spare the primary (default: 0)')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть положительным')
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        archived = archive_orders(
+            cutoff, options['chunk_size'], options['max_chunks'], options['pause'],
+            progress=lambda total: self.stdout.write(f'Перенесено в архив: {total}'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Готово, заказов в архиве добавлено: {archived}'))
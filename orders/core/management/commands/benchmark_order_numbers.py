@@ -0,0 +1,137 @@
+import multiprocessing
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend.models import Cart, CartItem, Category, Contact, Order, Product, ProductInfo, Shop, User
+from backend.numbers import ORDER_NUMBER_BLOCK, ORDER_NUMBER_SEQUENCE, order_numbers
+from backend.views import OrderViewSet
+
+BENCHMARK_NAME = 'benchmark_order_numbers'
+
+
+def _checkout_worker(args):
+    # Процесс-потомок: своё соединение и свой блок номеров (HiLoSequence
+    # замечает смену pid). Корзины готовятся до барьера, замеряется только
+    # оформление — тот же create_from_cart, что и в API.
+    user_id, contact_id, info_id, orders, barrier = args
+    user = User.objects.get(pk=user_id)
+    info = ProductInfo.objects.get(pk=info_id)
+    carts = []
+    for _ in range(orders):
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product_info=info, quantity=1, price=info.price)
+        carts.append(cart.pk)
+
+    # Время выдачи номера отдельно от оформления: у hi/lo оно не должно
+    # расти с числом процессов.
+    numbering = []
+    next_number = order_numbers.next
+
+    def timed_next():
+        started = time.perf_counter()
+        try:
+            return next_number()
+        finally:
+            numbering.append(time.perf_counter() - started)
+
+    order_numbers.next = timed_next
+    view = OrderViewSet.as_view({'post': 'create_from_cart'})
+    factory = APIRequestFactory()
+
+    barrier.wait()
+    started = time.monotonic()
+    created, latencies = [], []
+    for cart_id in carts:
+        request = factory.post('/orders/create_from_cart/', {'cart_id': cart_id, 'contact_id': contact_id},
+                               format='json')
+        force_authenticate(request, user=user)
+        request_started = time.perf_counter()
+        response = view(request)
+        latencies.append(time.perf_counter() - request_started)
+        if response.status_code != 201:
+            raise RuntimeError(f'create_from_cart: {response.status_code} {response.data}')
+        created.append((response.data['id'], response.data['number']))
+    finished = time.monotonic()
+    connections.close_all()
+    return started, finished, created, latencies, numbering
+
+
+class Command(BaseCommand):
+    help = ('Measures checkout (create_from_cart) throughput with hi/lo order numbers '
+            'as worker processes are added')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help='Worker process counts to try (default: 1 2 4 8)')
+        parser.add_argument('--orders', type=int, default=500, help='Orders created per worker (default: 500)')
+        parser.add_argument('--keep', action='store_true', help='Do not delete the data created by the run')
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        workers_max = max(options['workers'])
+        shop, category, buyers = self.create_buyers(workers_max, options['orders'] * len(options['workers']))
+        self.stdout.write(f"{'workers':>8} {'orders':>8} {'seconds':>8} {'orders/s':>10} {'per worker':>11} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'number µs':>10} {'blocks':>7}")
+        try:
+            for workers in options['workers']:
+                # Потомки не должны делить с родителем открытое соединение.
+                before = self.sequence_value()
+                connections.close_all()
+                with context.Manager() as manager:
+                    barrier = manager.Barrier(workers)
+                    with context.Pool(workers) as pool:
+                        results = pool.map(_checkout_worker, [
+                            (*buyers[n], options['orders'], barrier) for n in range(workers)
+                        ])
+                # Каждый nextval забирает блок; остальные номера выдаются из памяти.
+                blocks = (self.sequence_value() - before) // ORDER_NUMBER_BLOCK
+                self.report(workers, results, blocks)
+        finally:
+            if not options['keep']:
+                Order.objects.filter(user__in=[user_id for user_id, _, _ in buyers]).delete()
+                shop.delete()
+                Product.objects.filter(category=category).delete()
+                category.delete()
+                User.objects.filter(pk__in=[user_id for user_id, _, _ in buyers]).delete()
+
+    def create_buyers(self, count, orders):
+        # У каждого процесса свой покупатель и свой товар: оформления не
+        # ждут друг друга на строке остатка, и замер показывает нумерацию.
+        shop = Shop.objects.create(name=BENCHMARK_NAME)
+        category = Category.objects.create(name=BENCHMARK_NAME)
+        buyers = []
+        for n in range(count):
+            user = User.objects.create_user(username=f'{BENCHMARK_NAME}_{n}',
+                                            email=f'{BENCHMARK_NAME}_{n}@example.com')
+            contact = Contact.objects.create(user=user, last_name='Бенчмарк', first_name=str(n),
+                                             email=user.email)
+            product = Product.objects.create(name=f'{BENCHMARK_NAME} {n}', category=category)
+            info = ProductInfo.objects.create(product=product, shop=shop, name=f'{BENCHMARK_NAME}/{n}',
+                                              quantity=orders, price=100, price_rrc=100)
+            buyers.append((user.pk, contact.pk, info.pk))
+        return shop, category, buyers
+
+    def sequence_value(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT last_value FROM {ORDER_NUMBER_SEQUENCE}')
+            return cursor.fetchone()[0]
+
+    def report(self, workers, results, blocks):
+        created = [row for result in results for row in result[2]]
+        numbers = [number for _, number in created]
+        if len(set(numbers)) != len(numbers):
+            raise CommandError(f'{workers} процессов: номера заказов повторяются')
+        latencies = sorted(latency for result in results for latency in result[3])
+        numbering = [elapsed for result in results for elapsed in result[4]]
+
+        elapsed = max(result[1] for result in results) - min(result[0] for result in results)
+        rate = len(created) / elapsed
+        self.stdout.write(
+            f'{workers:>8} {len(created):>8} {elapsed:>8.2f} {rate:>10.0f} {rate / workers:>11.0f} '
+            f'{statistics.median(latencies) * 1000:>8.2f} {latencies[int(len(latencies) * 0.95)] * 1000:>8.2f} '
+            f'{statistics.mean(numbering) * 1e6:>10.1f} {blocks:>7}'
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from backend.export import EXPORT_FORMATS, export_lines, export_queryset, export_rows, parse_changed_since
+from backend.models import Shop
+
+
+class Command(BaseCommand):
+    help = 'Streams the catalog (ProductInfo rows) as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson',
+                            help='Output format (default: ndjson)')
+        parser.add_argument('--shop', type=str, help='Export only this shop (name)')
+        parser.add_argument('--changed-since', type=str,
+                            help='Export only rows changed since this ISO 8601 date or datetime')
+        parser.add_argument('--output', type=str, help='Output file (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched per server-side cursor round-trip (default: 2000)')
+
+    def handle(self, *args, **options):
+        shop_id = None
+        if options['shop']:
+            shop_id = Shop.objects.filter(name=options['shop']).values_list('id', flat=True).first()
+            if shop_id is None:
+                raise CommandError(f"Магазин {options['shop']} не найден")
+        changed_since = None
+        if options['changed_since']:
+            changed_since = parse_changed_since(options['changed_since'])
+            if changed_since is None:
+                raise CommandError('--changed-since: ожидается дата или время в ISO 8601')
+
+        rows = export_rows(export_queryset(shop_id, changed_since), options['chunk_size'])
+        lines = export_lines(options['format'], rows)
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines)
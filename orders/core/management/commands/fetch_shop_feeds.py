@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from backend.models import Shop
+from core.feeds import fetch_and_import, make_session
+
+
+class Command(BaseCommand):
+    help = 'Fetches shop price lists from Shop.url and imports the changed ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('shops', nargs='*', type=str, help='Shop names (default: all shops with url)')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent downloads (default: 8)')
+        parser.add_argument('--timeout', type=float, default=30, help='HTTP timeout in seconds (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per batch in the importer (default: 1000)')
+        parser.add_argument('--force', action='store_true',
+                            help='Ignore stored ETag / Last-Modified and download every feed')
+        parser.add_argument('--keep-missing', action='store_true',
+                            help='Do not zero the quantity of goods missing from the feed')
+
+    def handle(self, *args, **options):
+        shops = Shop.objects.exclude(url__isnull=True).exclude(url='')
+        if options['shops']:
+            shops = shops.filter(name__in=options['shops'])
+        shops = list(shops)
+        if not shops:
+            self.stdout.write(self.style.WARNING('Нет магазинов со ссылкой на прайс'))
+            return
+
+        started = time.perf_counter()
+        session = make_session(options['workers'])
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(fetch_and_import, session, shop, options['timeout'],
+                                options['batch_size'], options['force'], options['keep_missing']): shop
+                for shop in shops
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'Ошибка ({futures[future].name}): {str(e)}'))
+                    continue
+                if result['status'] == 'not_modified':
+                    self.stdout.write(f"{result['shop']}: прайс не изменился")
+                    continue
+                goods = result['stats'].goods
+                self.stdout.write(self.style.SUCCESS(
+                    f"{result['shop']}: импортировано {result['goods']} товаров за {result['elapsed']:.2f} с "
+                    f"(новых {goods['new']}, изменённых {goods['changed']}, пропавших {goods['removed']})"
+                ))
+        session.close()
+        self.stdout.write(f'Готово за {time.perf_counter() - started:.2f} с')
@@ -1,25 +1,128 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import django
 import yaml
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from backend.models import (
+    Shop, Category, Product, ProductInfo, Parameter, ProductParameter, product_info_changes,
+    product_info_params,
+)
+from backend.cache import bump_autocomplete_version
+from backend.changes import record_changes
+from backend.facets import rebuild_facets
+from backend.offers import refresh_catalog_on_commit
+from backend.search import refresh_search_text
+from core.importer import BulkImporter, import_price_list
+from core.price_list import PriceListReader
+
+
+def init_worker():
+    """Инициализация рабочего процесса пула: Django и свои соединения с БД."""
+    django.setup()
+    connections.close_all()
 
 
 class Command(BaseCommand):
-    help = 'Imports products from YAML file'
+    help = 'Imports products from YAML files'
 
     def add_arguments(self, parser):
-        parser.add_argument('file_path', type=str, help='Path to YAML file')
+        parser.add_argument('file_paths', nargs='+', type=str,
+                            help='YAML files or directories with *.yaml / *.yml files')
+        parser.add_argument('--bulk', action='store_true',
+                            help='Import with set-based lookups and batched bulk upserts')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per batch in bulk mode (default: 1000)')
+        parser.add_argument('--stream', action='store_true',
+                            help='Parse the file as a YAML event stream with constant memory '
+                                 '(implies --bulk; shop and categories must precede goods)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Import files concurrently in N processes (implies --stream)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many goods are new, changed, unchanged or gone '
+                                 '(implies --bulk, writes nothing)')
+        parser.add_argument('--keep-missing', action='store_true',
+                            help='Do not zero the quantity of goods missing from the feed in bulk mode')
 
     def handle(self, *args, **options):
-        yaml_file_path = options['file_path']
+        paths = self.collect_paths(options['file_paths'])
+        if options['workers'] > 1:
+            self.import_parallel(paths, options)
+            return
+        for path in paths:
+            self.import_file(path, options)
 
+    def collect_paths(self, file_paths):
+        paths = []
+        for file_path in map(Path, file_paths):
+            if file_path.is_dir():
+                paths.extend(sorted(p for p in file_path.iterdir() if p.suffix in ('.yaml', '.yml')))
+            else:
+                paths.append(file_path)
+        if not paths:
+            raise CommandError('Не найдено ни одного YAML файла')
+        return paths
+
+    def import_parallel(self, paths, options):
+        # Дочерние процессы не должны унаследовать открытые соединения с БД.
+        # Пул явно на fork: рабочие получают настройки родителя (в том числе
+        # имя тестовой базы), а не перечитывают их, как при spawn.
+        connections.close_all()
+        started = time.perf_counter()
+        total_rows = total_goods = 0
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 mp_context=multiprocessing.get_context('fork'),
+                                 initializer=init_worker) as executor:
+            futures = {
+                executor.submit(import_price_list, path, options['batch_size'],
+                                options['dry_run'], options['keep_missing']): path
+                for path in paths
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'Ошибка ({futures[future]}): {str(e)}'))
+                    continue
+                rows = result['stats'].processed
+                total_rows += rows
+                total_goods += result['goods']
+                self.stdout.write(self.style.SUCCESS(
+                    f"{result['shop']}: {result['goods']} товаров, {rows} строк за "
+                    f"{result['elapsed']:.2f} с ({rows / result['elapsed']:.0f} строк/с)"
+                ))
+                self.write_diff(result['stats'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Итого: {len(paths)} файлов, {total_goods} товаров, {total_rows} строк за "
+            f"{elapsed:.2f} с ({total_rows / elapsed:.0f} строк/с)"
+        ))
+
+    def import_file(self, yaml_file_path, options):
         try:
+            if options['stream']:
+                with open(yaml_file_path, 'r', encoding='utf-8') as file:
+                    reader = PriceListReader(file)
+                    try:
+                        header = reader.read_header()
+                        self.import_bulk(header, reader.goods(), options)
+                    finally:
+                        reader.close()
+                return
+
             with open(yaml_file_path, 'r', encoding='utf-8') as file:
                 data = yaml.safe_load(file)
 
             if not isinstance(data, dict):
                 raise ValueError("YAML файл должен содержать словарь с данными магазина")
 
+            if options['bulk'] or options['dry_run']:
+                self.import_bulk(data, data['goods'], options)
+                return
+
             with transaction.atomic():
                 # Создаем/обновляем магазин
                 shop, _ = Shop.objects.get_or_create(
@@ -38,6 +141,8 @@ class Command(BaseCommand):
                     category.shops.add(shop)
 
                 # Обрабатываем товары
+                touched = []
+                touched_products = []
                 for product_data in data['goods']:
                     category_id = product_data['category']
                     if category_id not in category_map:
@@ -63,7 +168,12 @@ class Command(BaseCommand):
                             'name': product_data['model'],
                             'price': product_data['price'],
                             'price_rrc': product_data['price_rrc'],
-                            'quantity': product_data['quantity']
+                            'quantity': product_data['quantity'],
+                            # Отпечаток описывает содержимое bulk-импорта; после
+                            # построчной записи он недействителен.
+                            'fingerprint': '',
+                            **product_info_changes(),
+                            'params': product_info_params(product_data.get('parameters', {})),
                         }
                     )
 
@@ -75,10 +185,56 @@ class Command(BaseCommand):
                             parameter=parameter,
                             defaults={'value': str(param_value)}
                         )
+                    touched.append(product_info.pk)
+                    touched_products.append(product.pk)
+
+                refresh_search_text(touched)
+                rebuild_facets(shop.pk)
+                record_changes(touched)
+                refresh_catalog_on_commit([shop.pk], touched_products)
+                transaction.on_commit(bump_autocomplete_version)
 
             self.stdout.write(self.style.SUCCESS(
                 f"Успешно импортирован магазин {data['shop']} с {len(data['goods'])} товарами"
             ))
 
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Ошибка: {str(e)}'))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f'Ошибка: {str(e)}'))
+
+    def import_bulk(self, data, goods, options):
+        importer = BulkImporter(batch_size=options['batch_size'], dry_run=options['dry_run'],
+                                warn=lambda message: self.stdout.write(self.style.WARNING(message)))
+        with transaction.atomic():
+            shop = importer.import_shop(data['shop'])
+            importer.import_categories(shop, data['categories'])
+            imported = importer.import_goods(shop, goods)
+            if not options['keep_missing']:
+                importer.zero_missing(shop)
+
+        if options['dry_run']:
+            self.stdout.write(f"Пробный запуск для магазина {data['shop']}, {imported} товаров, ничего не записано")
+            self.write_diff(importer.stats)
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Успешно импортирован магазин {data['shop']} с {imported} товарами"
+        ))
+        self.write_diff(importer.stats)
+        self.write_stats(importer.stats)
+
+    def write_diff(self, stats):
+        goods = stats.goods
+        self.stdout.write(
+            f"  Товары: новых {goods['new']}, изменённых {goods['changed']}, "
+            f"без изменений {goods['unchanged']}, пропавших из прайса {goods['removed']}"
+        )
+
+    def write_stats(self, stats):
+        for model, counter in stats.rows.items():
+            self.stdout.write(
+                f"  {model}: вставлено {counter['inserted']}, обновлено {counter['updated']}, "
+                f"без изменений {counter['unchanged']}, удалено {counter['deleted']}"
+            )
+        if stats.skipped:
+            self.stdout.write(f"  Пропущено товаров: {stats.skipped}")
+        for phase, elapsed in stats.timings.items():
+            self.stdout.write(f"  {phase}: {elapsed:.3f} с")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from backend.rollups import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily sales rollups from live and archived orders in parallel chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Order ids per chunk (default: 10000)')
+        parser.add_argument('--workers', type=int, default=4, help='Chunks processed in parallel (default: 4)')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size и --workers должны быть положительными')
+        chunks = rebuild_sales(
+            options['chunk_size'], options['workers'],
+            progress=lambda done, total: self.stdout.write(f'Диапазонов обработано: {done}/{total}'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Сводки продаж пересчитаны, диапазонов: {chunks}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from backend.reservations import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Cancels new orders whose stock reservation has expired and returns the stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Orders released per transaction (default: 100)')
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations(batch_size=options['batch_size'])
+        self.stdout.write(f'Отменено заказов с истёкшим резервом: {released}')
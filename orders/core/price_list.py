@@ -0,0 +1,102 @@
+import yaml
+from yaml.events import (
+    AliasEvent, DocumentStartEvent, MappingEndEvent, MappingStartEvent, ScalarEvent,
+    SequenceEndEvent, SequenceStartEvent,
+)
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+
+# C-парсер на порядок быстрее, но доступен не во всех сборках PyYAML.
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class PriceListReader:
+    """
+    Потоковое чтение прайс-листа (shop / categories / goods) по событиям YAML.
+
+    Заголовок (всё до ключа goods) читается целиком, товары отдаются по
+    одному, поэтому в памяти никогда не держится больше одного товара.
+    """
+
+    def __init__(self, stream):
+        self.loader = Loader(stream)
+        self.header = None
+        self.has_goods = False
+
+    def read_header(self):
+        loader = self.loader
+        loader.get_event()
+        if loader.check_event(DocumentStartEvent):
+            loader.get_event()
+        if not loader.check_event(MappingStartEvent):
+            raise ValueError("YAML файл должен содержать словарь с данными магазина")
+        loader.get_event()
+
+        self.header = {}
+        while not loader.check_event(MappingEndEvent):
+            key = self._construct()
+            if key == 'goods':
+                self.has_goods = True
+                break
+            self.header[key] = self._construct()
+
+        missing = {'shop', 'categories'} - self.header.keys()
+        if missing:
+            raise ValueError(
+                f"В потоковом режиме ключи {', '.join(sorted(missing))} должны идти перед goods"
+            )
+        return self.header
+
+    def goods(self):
+        if self.header is None:
+            self.read_header()
+        loader = self.loader
+        if not self.has_goods:
+            return
+        if loader.check_event(ScalarEvent):
+            # "goods:" без значений
+            loader.get_event()
+            return
+        if not loader.check_event(SequenceStartEvent):
+            raise ValueError("goods должен быть списком товаров")
+        loader.get_event()
+        while not loader.check_event(SequenceEndEvent):
+            yield self._construct()
+        loader.get_event()
+
+    def close(self):
+        self.loader.dispose()
+
+    def _construct(self):
+        return self.loader.construct_document(self._compose())
+
+    def _compose(self):
+        # Упрощённый Composer: строит узел одного значения из событий парсера.
+        # Якоря не запоминаются, чтобы память не росла вместе с файлом.
+        loader = self.loader
+        event = loader.get_event()
+        if isinstance(event, AliasEvent):
+            raise ValueError("Ссылки YAML (alias) не поддерживаются в потоковом режиме")
+        if isinstance(event, ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(ScalarNode, event.value, event.implicit)
+            return ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+
+        if isinstance(event, SequenceStartEvent):
+            node_class, end_event = SequenceNode, SequenceEndEvent
+        elif isinstance(event, MappingStartEvent):
+            node_class, end_event = MappingNode, MappingEndEvent
+        else:
+            raise ValueError(f"Неожиданное событие YAML: {event}")
+
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(node_class, None, event.implicit)
+        node = node_class(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(end_event):
+            if node_class is MappingNode:
+                node.value.append((self._compose(), self._compose()))
+            else:
+                node.value.append(self._compose())
+        node.end_mark = loader.get_event().end_mark
+        return node
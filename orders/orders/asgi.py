@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'orders.settings')
 
 application = get_asgi_application()
+
+# Индекс подсказок каталога строится в фоне при старте процесса.
+from backend.autocomplete import autocomplete  # noqa: E402
+
+autocomplete.warm()
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'backend',
@@ -88,6 +89,29 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# catalog — кэш ответов /products/ (backend.cache). LocMemCache вытесняет по
+# LRU при MAX_ENTRIES; в продакшене нужен общий для всех воркеров кэш, например
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+# 'LOCATION': 'redis://127.0.0.1:6379/1' с maxmemory-policy allkeys-lru.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -148,6 +172,13 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ),
 }
+# Размер страницы KeysetPagination по умолчанию и верхняя граница ?page_size=
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Сколько минут держится резерв товара под неподтверждённым заказом
+STOCK_RESERVATION_MINUTES = 30
+
 DEFAULT_FROM_EMAIL = 'noreply@yourdomain.com'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
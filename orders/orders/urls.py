@@ -3,9 +3,12 @@ from rest_framework.routers import DefaultRouter
 from backend.views import CustomAuthToken
 from backend.views import (
     RegisterView, login_view,
-    ProductInfoListView, ProductInfoDetailView,
+    ProductInfoListView, ProductFacetsView, ProductInfoBatchView, BestOfferListView,
+    autocomplete_view, changes_view, export_view,
+    ProductInfoDetailView, ShopPriceUpdateView,
     CartView, AddCartItemView, RemoveCartItemView,
-    ContactViewSet, OrderViewSet
+    ContactViewSet, OrderViewSet,
+    sales_daily_view, sales_products_view,
 )
 
 router = DefaultRouter()
@@ -16,7 +19,16 @@ urlpatterns = [
     path('auth/register/', RegisterView.as_view()),
     path('auth/login/', login_view),
     path('products/', ProductInfoListView.as_view()),
+    path('products/facets/', ProductFacetsView.as_view()),
+    path('products/batch/', ProductInfoBatchView.as_view()),
+    path('products/best-offers/', BestOfferListView.as_view()),
+    path('products/autocomplete/', autocomplete_view),
+    path('products/export/', export_view),
+    path('products/changes/', changes_view),
     path('products/<int:pk>/', ProductInfoDetailView.as_view()),
+    path('shops/<int:pk>/prices/', ShopPriceUpdateView.as_view()),
+    path('reports/sales/', sales_daily_view),
+    path('reports/sales/products/', sales_products_view),
     path('cart/', CartView.as_view()),
     path('cart/add/', AddCartItemView.as_view()),
     path('cart/item/<int:pk>/remove/', RemoveCartItemView.as_view()),